@@ -0,0 +1,353 @@
+# coding: utf8
+"""Headless FileDiffs benchmarks.
+
+Runs `run_diff`, `prep_content`, `find_files` and `diff_with_external` over
+synthetic corpora with a stub of the Sublime Text API, and times loading
+the plugin and rendering its menus. Writes the results as JSON, and exits
+with status 1 when a result is over its threshold in thresholds.json, or
+slower than a previous result file by more than the allowed ratio.
+
+    python bench/benchmark.py --quick
+    python bench/benchmark.py --output bench_output.json
+    python bench/benchmark.py --baseline bench_output.json
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from fnmatch import fnmatch
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, os.path.join(HERE, 'stubs'))
+sys.path.insert(0, HERE)
+
+import sublime  # noqa: E402 (the stub)
+import sublime_plugin  # noqa: E402
+import corpora  # noqa: E402
+
+
+def load_plugin():
+    """Import file_diffs.py as a module of a "FileDiffs" package, the way
+    Sublime Text loads it, so its relative imports work."""
+    package = types.ModuleType('FileDiffs')
+    package.__path__ = [ROOT]
+    sys.modules['FileDiffs'] = package
+    module = importlib.import_module('FileDiffs.file_diffs')
+    module.plugin_loaded()
+    return module
+
+
+file_diffs = load_plugin()
+settings = sublime.load_settings('FileDiffs.sublime-settings')
+
+# imports the plugin the way load_plugin does, in a fresh interpreter, and
+# prints how long it took
+LOAD_PLUGIN = '''import importlib, sys, time, types
+sys.path.insert(0, {stubs!r})
+import sublime, sublime_plugin
+package = types.ModuleType('FileDiffs')
+package.__path__ = [{root!r}]
+sys.modules['FileDiffs'] = package
+start = time.perf_counter()
+importlib.import_module('FileDiffs.file_diffs').plugin_loaded()
+print(time.perf_counter() - start)
+'''.format(stubs=os.path.join(HERE, 'stubs'), root=ROOT)
+
+# a diff tool that reads both files and exits
+DUMMY_TOOL = 'import sys\nfor name in sys.argv[1:]:\n    open(name, "rb").read()\n'
+
+
+def measure(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def result(name, durations, **info):
+    entry = {
+        'name': name,
+        'runs': len(durations),
+        'median': statistics.median(durations),
+        'min': min(durations),
+        'max': max(durations),
+    }
+    entry.update(info)
+    return entry
+
+
+class Benchmarks(object):
+    def __init__(self, repeat, algorithms, sizes, densities, repeated_ratios, tree_sizes):
+        self.repeat = repeat
+        self.algorithms = algorithms
+        self.sizes = sizes
+        self.densities = densities
+        self.repeated_ratios = repeated_ratios
+        self.tree_sizes = tree_sizes
+        self.window = sublime.Window()
+        self.results = []
+
+    def log(self, entry):
+        self.results.append(entry)
+        sys.stderr.write('{:<64} {:>10.4f}s\n'.format(entry['name'], entry['median']))
+
+    def run(self):
+        settings.set('open_in_sublime', True)
+        for size in self.sizes:
+            for repeated_ratio in self.repeated_ratios:
+                a_lines = corpora.make_lines(size, repeated_ratio)
+                a_text = ''.join(a_lines)
+                self.bench_prep_content(a_text, size, repeated_ratio)
+                for density in self.densities:
+                    b_text = ''.join(corpora.mutate(a_lines, density))
+                    label = 'lines={}/edits={}/repeated={}'.format(size, density, repeated_ratio)
+                    for algorithm in self.algorithms:
+                        self.bench_run_diff(algorithm, a_text, b_text, label)
+                    self.bench_run_diff_cached(a_text, b_text, label)
+                    self.bench_run_diff_full_context(a_text, b_text, label)
+        self.bench_multi_diff()
+        self.bench_diff_with_external()
+        self.bench_plugin_load()
+        self.bench_menu()
+        for file_count in self.tree_sizes:
+            self.bench_find_files(file_count)
+            self.bench_folder_diff(file_count)
+        return self.results
+
+    def run_diff(self, a, b):
+        view = self.window.open_view(b, name='bench')
+        command = file_diffs.FileDiffCommand(view)
+        command.run_diff(a, b, 'a.txt', 'b.txt')
+        job = file_diffs.current_job
+        if job is not None:
+            sublime.pump(lambda: job.done and sublime.async_idle())
+        # drop the diff views, so memory use doesn't grow over the run
+        for v in self.window.views():
+            self.window.close_view(v)
+        file_diffs.scratches.clear()
+        return job
+
+    def bench_run_diff(self, algorithm, a, b, label):
+        settings.set('diff_algorithm', algorithm)
+        settings.set('diff_cache_size', 0)
+        timer = []
+
+        def run():
+            job = self.run_diff(a, b)
+            timer.append(job.timer)
+        durations = measure(run, self.repeat)
+        self.log(result('run_diff/{}/{}'.format(algorithm, label), durations,
+            hunks=timer[-1].stats.get('hunks'),
+            phases=dict((name, round(seconds, 6)) for name, seconds in timer[-1].phases.items())))
+
+    def bench_run_diff_cached(self, a, b, label):
+        settings.set('diff_algorithm', 'myers')
+        settings.set('diff_cache_size', 256)
+        file_diffs.diff_cache.clear()
+        self.run_diff(a, b)
+        durations = measure(lambda: self.run_diff(a, b), self.repeat)
+        self.log(result('run_diff_cached/{}'.format(label), durations))
+        settings.set('diff_cache_size', 0)
+
+    def bench_run_diff_full_context(self, a, b, label):
+        settings.set('diff_algorithm', 'myers')
+        settings.set('context_lines', 'full')
+        for fold in (True, False):
+            settings.set('fold_full_context', fold)
+            durations = measure(lambda: self.run_diff(a, b), self.repeat)
+            self.log(result('run_diff_full_context/{}/{}'.format('folded' if fold else 'unfolded', label), durations))
+        settings.erase('context_lines')
+        settings.erase('fold_full_context')
+
+    def bench_prep_content(self, text, size, repeated_ratio):
+        view = self.window.open_view(text, name='bench')
+        command = file_diffs.FileDiffCommand(view)
+        durations = measure(lambda: command.prep_content(text, 'a.txt', 'from_file'), self.repeat)
+        self.log(result('prep_content/lines={}/repeated={}'.format(size, repeated_ratio), durations))
+        self.window.close_view(view)
+
+    def bench_multi_diff(self):
+        base = corpora.make_lines(max(self.sizes) // 10, 0.3)
+        texts = [''.join(corpora.mutate(base, 0.02, seed=seed)) for seed in range(8)]
+        view = self.window.open_view(texts[0], name='bench')
+        command = file_diffs.FileDiffTabsCommand(view)
+        settings.set('diff_algorithm', 'myers')
+
+        def run():
+            command.run_multi_diff(['input {}'.format(index) for index in range(len(texts))], texts, all_pairs=True)
+            job = file_diffs.current_job
+            sublime.pump(lambda: job.done and sublime.async_idle())
+            for v in self.window.views():
+                if v is not view:
+                    self.window.close_view(v)
+            file_diffs.scratches.clear()
+        durations = measure(run, self.repeat)
+        self.log(result('multi_diff/all_pairs/inputs={}/lines={}'.format(len(texts), len(base)), durations))
+        self.window.close_view(view)
+
+    def bench_diff_with_external(self):
+        a_lines = corpora.make_lines(max(self.sizes), 0.3)
+        a = ''.join(a_lines)
+        b = ''.join(corpora.mutate(a_lines, 0.01))
+        view = self.window.open_view(b, name='bench')
+        command = file_diffs.FileDiffCommand(view)
+        tool = [sys.executable, '-c', DUMMY_TOOL, '$file1', '$file2']
+
+        def run():
+            command.diff_with_external(tool, a, b, 'a.txt', 'b.txt')
+            while file_diffs.diff_tools.running or file_diffs.diff_tools.queue:
+                time.sleep(0.001)
+        durations = measure(run, self.repeat)
+        self.log(result('diff_with_external/lines={}'.format(max(self.sizes)), durations))
+        self.window.close_view(view)
+
+    def bench_plugin_load(self):
+        durations = []
+        for _ in range(self.repeat):
+            output = subprocess.check_output([sys.executable, '-c', LOAD_PLUGIN])
+            durations.append(float(output))
+        self.log(result('plugin_load', durations))
+
+    def bench_menu(self, calls=1000):
+        """is_visible of every context menu command, which Sublime Text calls
+        each time the menu is shown."""
+        view = self.window.open_view('text\n', os.path.join(ROOT, 'file_diffs.py'))
+        commands = [value(view) for value in vars(file_diffs).values()
+            if isinstance(value, type) and issubclass(value, sublime_plugin.TextCommand) and 'is_visible' in vars(value)]
+
+        def run():
+            for _ in range(calls):
+                for command in commands:
+                    command.is_visible()
+        durations = measure(run, self.repeat)
+        self.log(result('menu/is_visible/commands={}/calls={}'.format(len(commands), calls), durations))
+        self.window.close_view(view)
+
+    def bench_find_files(self, file_count):
+        root = tempfile.mkdtemp(prefix='file-diffs-bench-tree-')
+        try:
+            tree = corpora.make_tree(os.path.join(root, 'project'), file_count)
+            window = sublime.Window([tree])
+            view = window.open_view('', os.path.join(tree, 'current.py'))
+            command = file_diffs.FileDiffFileCommand(view)
+
+            def cold():
+                file_diffs.file_index._indexes.clear()
+                return command.find_files([tree])
+            durations = measure(cold, self.repeat)
+            files = len(cold())
+            self.log(result('find_files/cold/files={}'.format(file_count), durations, found=files))
+
+            durations = measure(lambda: command.find_files([tree]), self.repeat)
+            self.log(result('find_files/warm/files={}'.format(file_count), durations, found=files))
+        finally:
+            shutil.rmtree(root)
+
+    def bench_folder_diff(self, file_count):
+        root = tempfile.mkdtemp(prefix='file-diffs-bench-folders-')
+        try:
+            left = corpora.make_tree(os.path.join(root, 'left'), file_count)
+            right = os.path.join(root, 'right')
+            shutil.copytree(left, right)
+            corpora.touch_tree(right, 0.05, changed=0.01)
+            window = sublime.Window([root])
+            command = file_diffs.FileDiffFolderCommand(window)
+
+            def run():
+                command.compare(left, right)
+                job = file_diffs.current_job
+                sublime.pump(lambda: job.done and sublime.async_idle())
+                summary = window.views()[-1]
+                for v in window.views():
+                    window.close_view(v)
+                file_diffs.scratches.clear()
+                return summary
+            durations = measure(run, self.repeat)
+            summary = run().substr(sublime.Region(0, 10 ** 9)).split('\n')[2]
+            self.log(result('folder_diff/files={}'.format(file_count), durations, summary=summary))
+        finally:
+            shutil.rmtree(root)
+
+
+def check(results, thresholds, baseline):
+    """Messages for every result that is over its threshold, or slower than
+    the baseline result of the same name by more than the allowed ratio."""
+    problems = []
+    for entry in results:
+        for pattern, limit in thresholds.get('max_seconds', {}).items():
+            if fnmatch(entry['name'], pattern):
+                if entry['median'] > limit:
+                    problems.append('{}: {:.4f}s is over the {}s threshold'.format(entry['name'], entry['median'], limit))
+                break
+
+    if baseline:
+        ratio = thresholds.get('max_baseline_ratio', 1.3)
+        previous = dict((entry['name'], entry) for entry in baseline.get('results', []))
+        for entry in results:
+            old = previous.get(entry['name'])
+            # ignore noise on very short benchmarks
+            if old and entry['median'] > old['median'] * ratio and entry['median'] - old['median'] > 0.005:
+                problems.append('{}: {:.4f}s is {:.2f}x the baseline {:.4f}s'.format(
+                    entry['name'], entry['median'], entry['median'] / old['median'], old['median']))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--quick', action='store_true', help='smaller corpora, for a fast check')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--algorithms', default=','.join(file_diffs.diff_engine.ALGORITHMS))
+    parser.add_argument('--output', help='write the JSON results here instead of to stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--thresholds', default=os.path.join(HERE, 'thresholds.json'))
+    args = parser.parse_args()
+
+    if args.quick:
+        sizes, densities, repeated_ratios, tree_sizes = [1000, 10000], [0.01], [0.1, 0.6], [1000]
+    else:
+        sizes, densities, repeated_ratios, tree_sizes = [1000, 10000, 100000], [0.001, 0.01, 0.1], [0.1, 0.6], [1000, 10000, 100000]
+
+    benchmarks = Benchmarks(args.repeat, args.algorithms.split(','), sizes, densities, repeated_ratios, tree_sizes)
+    results = benchmarks.run()
+
+    thresholds = {}
+    if args.thresholds and os.path.exists(args.thresholds):
+        with open(args.thresholds) as f:
+            thresholds = json.load(f)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = check(results, thresholds, baseline)
+
+    output = json.dumps({
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+        'regressions': problems,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    for problem in problems:
+        sys.stderr.write('REGRESSION ' + problem + '\n')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
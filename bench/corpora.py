@@ -0,0 +1,78 @@
+# coding: utf8
+"""Synthetic inputs for the benchmarks."""
+import os
+import random
+
+
+REPEATED_LINES = ['\n', '}\n', '{\n', '    }\n', '    return;\n', '  </div>\n', '# ----\n']
+
+
+def make_lines(count, repeated_ratio=0.3, seed=0):
+    """`count` lines, of which about `repeated_ratio` come from a handful of
+    very common lines (blank lines, braces), like in code or generated files."""
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        if rng.random() < repeated_ratio:
+            lines.append(rng.choice(REPEATED_LINES))
+        else:
+            lines.append('    value_{} = compute({}, "{:x}")\n'.format(index, rng.randint(0, 1000), rng.getrandbits(32)))
+    return lines
+
+
+def mutate(lines, edit_density=0.01, seed=1):
+    """A copy of `lines` where about `edit_density` of the lines were changed,
+    inserted or deleted."""
+    rng = random.Random(seed)
+    result = []
+    for index, line in enumerate(lines):
+        if rng.random() >= edit_density:
+            result.append(line)
+            continue
+        edit = rng.random()
+        if edit < 0.5:
+            result.append(line.rstrip('\n') + ' # edited\n')
+        elif edit < 0.75:
+            result.append(line)
+            result.append('    inserted_{} = {}\n'.format(index, rng.getrandbits(16)))
+        # else the line is deleted
+    return result
+
+
+def make_tree(root, file_count, fanout=8, seed=0):
+    """A directory tree with `file_count` files, spread over nested folders,
+    plus some files and folders that FileDiffs excludes by default."""
+    rng = random.Random(seed)
+    dirs = [root]
+    os.makedirs(root)
+    for index in range(file_count):
+        if len(dirs) < file_count // fanout + 1 and rng.random() < 1.0 / fanout:
+            parent = rng.choice(dirs)
+            path = os.path.join(parent, 'dir{}'.format(len(dirs)))
+            os.makedirs(path)
+            dirs.append(path)
+        folder = rng.choice(dirs)
+        extension = rng.choice(['.py', '.txt', '.js', '.pyc', '.o'])
+        with open(os.path.join(folder, 'file{}{}'.format(index, extension)), 'w') as f:
+            f.write('x\n')
+    for folder in dirs[:10]:
+        os.makedirs(os.path.join(folder, '.git'))
+        with open(os.path.join(folder, '.git', 'HEAD'), 'w') as f:
+            f.write('ref: refs/heads/master\n')
+    return root
+
+
+def touch_tree(root, touched=0.05, changed=0.01, seed=2):
+    """Give about `touched` of the files under `root` a new mtime, and change
+    the content of about `changed` of them, like a fresh checkout would."""
+    rng = random.Random(seed)
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            roll = rng.random()
+            if roll < changed:
+                with open(path, 'a') as f:
+                    f.write('changed\n')
+            elif roll < touched:
+                os.utime(path, None)
@@ -0,0 +1,431 @@
+# coding: utf8
+"""Just enough of the Sublime Text API to run FileDiffs outside the editor.
+
+`set_timeout` callbacks run on the thread that calls `pump()`, standing in
+for the UI thread, and `set_timeout_async` callbacks run on a separate
+worker thread, like in Sublime Text.
+"""
+import heapq
+import itertools
+import os
+import queue
+import tempfile
+import threading
+import time
+
+
+DRAW_EMPTY = 1
+HIDE_ON_MINIMAP = 2
+DRAW_EMPTY_AS_OVERWRITE = 4
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 256
+DRAW_SOLID_UNDERLINE = 512
+HIDDEN = 128
+
+OP_EQUAL = 0
+OP_NOT_EQUAL = 1
+
+_platform = 'linux'
+_packages_path = tempfile.mkdtemp(prefix='file-diffs-bench-packages-')
+_cache_path = tempfile.mkdtemp(prefix='file-diffs-bench-cache-')
+
+
+def platform():
+    return _platform
+
+
+def packages_path():
+    return _packages_path
+
+
+def cache_path():
+    return _cache_path
+
+
+# -- settings
+
+class Settings(object):
+    def __init__(self, values=None):
+        self._values = dict(values or {})
+        self._on_change = {}
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+        for callback in list(self._on_change.values()):
+            callback()
+
+    def erase(self, key):
+        self._values.pop(key, None)
+        for callback in list(self._on_change.values()):
+            callback()
+
+    def has(self, key):
+        return key in self._values
+
+    def add_on_change(self, tag, callback):
+        self._on_change[tag] = callback
+
+    def clear_on_change(self, tag):
+        self._on_change.pop(tag, None)
+
+
+_settings = {}
+
+
+def load_settings(name):
+    if name not in _settings:
+        _settings[name] = Settings()
+    return _settings[name]
+
+
+# -- clipboard and status
+
+_clipboard = ''
+status_messages = []
+
+
+def get_clipboard():
+    return _clipboard
+
+
+def set_clipboard(text):
+    global _clipboard
+    _clipboard = text
+
+
+def status_message(message):
+    status_messages.append(message)
+
+
+def ok_cancel_dialog(message, ok_title=''):
+    return True
+
+
+# -- timeouts
+
+_main_lock = threading.Condition()
+_main_queue = []
+_counter = itertools.count()
+_async_queue = queue.Queue()
+_async_busy = threading.Event()
+
+
+def set_timeout(callback, delay=0):
+    with _main_lock:
+        heapq.heappush(_main_queue, (time.time() + delay / 1000.0, next(_counter), callback))
+        _main_lock.notify()
+
+
+def set_timeout_async(callback, delay=0):
+    if delay:
+        threading.Timer(delay / 1000.0, _async_queue.put, args=(callback,)).start()
+    else:
+        _async_queue.put(callback)
+
+
+def _async_worker():
+    while True:
+        callback = _async_queue.get()
+        _async_busy.set()
+        try:
+            callback()
+        finally:
+            _async_busy.clear()
+            _async_queue.task_done()
+
+threading.Thread(target=_async_worker, daemon=True).start()
+
+
+def pump(until, timeout=600):
+    """Run UI thread callbacks as they become due, until `until()` is true."""
+    deadline = time.time() + timeout
+    while not until():
+        if time.time() > deadline:
+            raise RuntimeError('timed out waiting for the UI thread')
+        callback = None
+        with _main_lock:
+            if _main_queue and _main_queue[0][0] <= time.time():
+                callback = heapq.heappop(_main_queue)[2]
+            else:
+                wait = 0.01
+                if _main_queue:
+                    wait = min(wait, max(_main_queue[0][0] - time.time(), 0))
+                _main_lock.wait(wait)
+        if callback is not None:
+            callback()
+
+
+def async_idle():
+    return _async_queue.unfinished_tasks == 0
+
+
+# -- regions, views and windows
+
+class Region(object):
+    def __init__(self, a, b=None):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, point):
+        return self.begin() <= point <= self.end()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return 'Region({}, {})'.format(self.a, self.b)
+
+
+class Selection(list):
+    def add(self, region):
+        self.append(region)
+
+    def clear(self):
+        del self[:]
+
+
+_ids = itertools.count(1)
+_windows = []
+
+
+class View(object):
+    def __init__(self, window=None, text='', file_name=None, name=''):
+        self._id = next(_ids)
+        self._window = window
+        self._text = text
+        self._file_name = file_name
+        self._name = name
+        self._sel = Selection([Region(0)])
+        self._settings = Settings()
+        self._status = {}
+        self._regions = {}
+        self._scratch = False
+        self._dirty = False
+        self._change_count = 0
+        self._line_endings = 'Unix'
+        self.popups = []
+
+    def id(self):
+        return self._id
+
+    def is_valid(self):
+        return True
+
+    def window(self):
+        return self._window
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def settings(self):
+        return self._settings
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, region):
+        if isinstance(region, int):
+            return self._text[region:region + 1]
+        return self._text[region.begin():region.end()]
+
+    def sel(self):
+        return self._sel
+
+    def is_dirty(self):
+        return self._dirty
+
+    def set_scratch(self, scratch):
+        self._scratch = scratch
+
+    def is_scratch(self):
+        return self._scratch
+
+    def set_syntax_file(self, syntax):
+        pass
+
+    def assign_syntax(self, syntax):
+        pass
+
+    def line_endings(self):
+        return self._line_endings
+
+    def change_count(self):
+        return self._change_count
+
+    def show_popup(self, content, *args, **kwargs):
+        self.popups.append(content)
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def get_status(self, key):
+        return self._status.get(key, '')
+
+    def add_regions(self, key, regions, scope='', icon='', flags=0):
+        self._regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, []))
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+
+    def text_point(self, row, col):
+        point = 0
+        for _ in range(row):
+            index = self._text.find('\n', point)
+            if index < 0:
+                return len(self._text)
+            point = index + 1
+        return point + col
+
+    def rowcol(self, point):
+        row = self._text.count('\n', 0, point)
+        return row, point - (self._text.rfind('\n', 0, point) + 1)
+
+    def line(self, point):
+        if isinstance(point, Region):
+            point = point.begin()
+        begin = self._text.rfind('\n', 0, point) + 1
+        end = self._text.find('\n', point)
+        if end < 0:
+            end = len(self._text)
+        return Region(begin, end)
+
+    def full_line(self, point):
+        region = self.line(point)
+        return Region(region.a, min(region.b + 1, len(self._text)))
+
+    def lines(self, region):
+        lines = []
+        point = region.begin()
+        while point <= region.end():
+            line = self.line(point)
+            lines.append(line)
+            if line.b >= len(self._text):
+                break
+            point = line.b + 1
+        return lines
+
+    def run_command(self, name, args=None):
+        import sublime_plugin
+        command = sublime_plugin.find_text_command(name)(self)
+        command.run(Edit(), **(args or {}))
+
+    # Edit operations, only valid inside a TextCommand
+    def insert(self, edit, point, text):
+        self._text = self._text[:point] + text + self._text[point:]
+        self._change_count += 1
+        return len(text)
+
+    def replace(self, edit, region, text):
+        self._text = self._text[:region.begin()] + text + self._text[region.end():]
+        self._change_count += 1
+
+    def erase(self, edit, region):
+        self.replace(edit, region, '')
+
+
+class Edit(object):
+    pass
+
+
+class Window(object):
+    def __init__(self, folders=()):
+        self._id = next(_ids)
+        self._views = []
+        self._folders = list(folders)
+        self._active = None
+        self.quick_panels = []
+        _windows.append(self)
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def active_group(self):
+        return 0
+
+    def views_in_group(self, group):
+        return list(self._views)
+
+    def folders(self):
+        return list(self._folders)
+
+    def project_data(self):
+        return {'folders': [{'path': folder} for folder in self._folders]}
+
+    def project_file_name(self):
+        return None
+
+    def new_file(self):
+        view = View(self)
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def open_view(self, text='', file_name=None, name=''):
+        view = View(self, text, file_name, name)
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def close_view(self, view):
+        self._views.remove(view)
+
+    def active_view(self):
+        return self._active
+
+    def find_open_file(self, file_name):
+        for view in self._views:
+            if view.file_name() == file_name:
+                return view
+        return None
+
+    def show_quick_panel(self, items, on_done, *args, **kwargs):
+        self.quick_panels.append((items, on_done))
+
+    def show_input_panel(self, caption, initial_text, on_done, on_change, on_cancel):
+        self.quick_panels.append(([caption, initial_text], on_done))
+
+    def run_command(self, name, args=None):
+        pass
+
+    def status_message(self, message):
+        status_message(message)
+
+
+def active_window():
+    return _windows[-1] if _windows else Window()
+
+
+def windows():
+    return list(_windows)
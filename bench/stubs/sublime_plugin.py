@@ -0,0 +1,59 @@
+# coding: utf8
+"""Command base classes for the `sublime` stub."""
+import re
+
+
+_text_commands = {}
+
+
+def _command_name(cls):
+    name = cls.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+
+class _CommandMeta(type):
+    def __init__(cls, name, bases, attrs):
+        super(_CommandMeta, cls).__init__(name, bases, attrs)
+        _text_commands[_command_name(cls)] = cls
+
+
+class TextCommand(object, metaclass=_CommandMeta):
+    def __init__(self, view):
+        self.view = view
+
+    def name(self):
+        return _command_name(type(self))
+
+    def is_visible(self, *args, **kwargs):
+        return True
+
+    def is_enabled(self, *args, **kwargs):
+        return True
+
+
+class WindowCommand(object, metaclass=_CommandMeta):
+    def __init__(self, window):
+        self.window = window
+
+    def name(self):
+        return _command_name(type(self))
+
+
+class ApplicationCommand(object, metaclass=_CommandMeta):
+    def name(self):
+        return _command_name(type(self))
+
+
+class EventListener(object):
+    pass
+
+
+class ViewEventListener(object):
+    def __init__(self, view):
+        self.view = view
+
+
+def find_text_command(name):
+    return _text_commands[name]
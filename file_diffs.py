@@ -1,19 +1,24 @@
 # coding: utf8
 import os
-import re
 import sys
+import time
 
 import sublime
 import sublime_plugin
-import difflib
-import tempfile
-import subprocess
-
-from fnmatch import fnmatch
-import codecs
-
-if sublime.platform() == "windows":
-    from subprocess import Popen
+import threading
+
+from .lib import diff_engine
+from .lib import file_index
+from .lib import content_cache
+from .lib import folder_diff
+from .lib import git_blobs
+from .lib import multi_diff
+from .lib import normalize
+from .lib.diff_cache import DiffCache
+from .lib.live_diff import LiveDiff
+from .lib.intraline import IntralineHighlighter
+from .lib.diff_tools import DiffTool, DiffToolManager
+from .lib.profiler import DiffTimer, Profiler
 
 
 class FileDiffMenuCommand(sublime_plugin.TextCommand):
@@ -28,12 +33,14 @@ class FileDiffMenuCommand(sublime_plugin.TextCommand):
         FILE        = {'text': u'Diff file with File in Project…',  'command' : 'file_diff_file'}
         TAB         = {'text': u'Diff file with Open Tab…',         'command' : 'file_diff_tab'}
         PREVIOUS    = {'text': 'Diff file with Previous Tab',       'command' : 'file_diff_previous'}
+        GIT         = {'text': u'Diff file with Git Revision…',     'command' : 'file_diff_git'}
+        TABS        = {'text': u'Diff Open Tabs…',                  'command' : 'file_diff_tabs'}
 
-        menu_items = [CLIPBOARD, SELECTIONS, SAVED, FILE, TAB, PREVIOUS]
+        menu_items = [CLIPBOARD, SELECTIONS, SAVED, FILE, TAB, PREVIOUS, GIT, TABS]
 
         non_empty_regions = len([region for region in self.view.sel() if not region.empty()])
 
-        if non_empty_regions != 2:
+        if non_empty_regions < 2:
             menu_items.remove(SELECTIONS)
 
         if non_empty_regions and non_empty_regions != 2:
@@ -47,6 +54,12 @@ class FileDiffMenuCommand(sublime_plugin.TextCommand):
         if not (self.view.file_name() and self.view.is_dirty()):
             menu_items.remove(SAVED)
 
+        if not (self.view.file_name() and git_blobs.find_repository(self.view.file_name())):
+            menu_items.remove(GIT)
+
+        if len(self.view.window().views()) < 3:
+            menu_items.remove(TABS)
+
         def on_done(index):
             if index >= 0:
                 self.view.run_command(menu_items[index]['command'], {'cmd': cmd})
@@ -55,7 +68,16 @@ class FileDiffMenuCommand(sublime_plugin.TextCommand):
 
 
 class FileDiffCommand(sublime_plugin.TextCommand):
+    # time spent reading the inputs of the next diff, see `run_diff`
+    capture_seconds = 0.0
+
     def diff_content(self, view):
+        start = time.time()
+        content = self._diff_content(view)
+        self.capture_seconds += time.time() - start
+        return content
+
+    def _diff_content(self, view):
         content = ''
 
         for region in view.sel():
@@ -90,49 +112,373 @@ class FileDiffCommand(sublime_plugin.TextCommand):
         return content
 
     def prep_content(self, ab, file_name, default_name):
-        content = ab.splitlines(True)
+        if isinstance(ab, list):
+            # lines from `read_file` are already split and normalized
+            content = ab
+        else:
+            content = content_cache.split_lines(ab)
         if file_name is None:
             file_name = default_name
-        content = [line.replace("\r\n", "\n").replace("\r", "\n") for line in content]
-
-        trim_trailing_white_space_before_diff = get_setting('trim_trailing_white_space_before_diff', False)
-        if trim_trailing_white_space_before_diff:
-            content = [line.rstrip() for line in content]
-
         return (content, file_name)
 
     def run_diff(self, a, b, from_file, to_file, **options):
-        external_diff_tool = options.get('cmd')
+        global current_job
+        if current_job is not None:
+            current_job.cancel()
 
+        summary_key = options.pop('summary_key', None)
         if options.get('reverse'):
             from_file, to_file = to_file, from_file
             a, b = b, a
-
-        (from_content, from_file) = self.prep_content(a, from_file, 'from_file')
-        (to_content, to_file) = self.prep_content(b, to_file, 'to_file')
+            if summary_key is not None:
+                summary_key = summary_key[::-1]
+
+        if isinstance(a, SkippedFile) or isinstance(b, SkippedFile) or self.too_large(a, b):
+            self.offer_summary(a, b, from_file, to_file, **options)
+            return
+        if same_content(a, b):
+            # nothing to diff, and no need to split and normalize the inputs
+            if summary_key is not None:
+                diff_summaries[summary_key] = (0, 0)
+            self.view.show_popup('No Difference')
+            return
 
         context_lines = get_setting("context_lines", 3);
+        fold = None
         if context_lines == "full":
             context_lines = sys.maxsize
+            # unchanged runs are only rendered when their fold is expanded
+            if get_setting('fold_full_context', True):
+                fold = get_setting('fold_context_lines', 3)
+
+        diff_algorithm = get_setting('diff_algorithm', 'difflib')
+        if diff_algorithm not in diff_engine.ALGORITHMS:
+            self.view.show_popup('Unknown diff_algorithm: {}'.format(diff_algorithm))
+            return
+
+        external_command = options.get('cmd') or get_setting('cmd')
+        open_in_sublime = get_setting('open_in_sublime', not external_command)
+        chunk_lines = get_setting('render_chunk_lines', 2000)
+        intraline_mode = open_in_sublime and get_setting('intraline_highlight', 'word')
+        large_file_threshold = get_setting('large_file_threshold', 1000000)
+        compact = bool(large_file_threshold) and content_length(a) + content_length(b) >= large_file_threshold
+
+        normalization = normalize_options()
+        if normalization[0] not in (None,) + normalize.WHITESPACE_MODES:
+            self.view.show_popup('Unknown ignore_whitespace: {}'.format(normalization[0]))
+            return
+        from_name = from_file if from_file is not None else 'from_file'
+        to_name = to_file if to_file is not None else 'to_file'
+
+        diff_cache.max_bytes = get_setting('diff_cache_size', 16) * 1024 * 1024
+
+        job = current_job = DiffJob(self.view)
+        timer = job.timer = DiffTimer(self.name())
+        timer.add('capture', self.capture_seconds)
+        self.capture_seconds = 0.0
+        timer.set('from_chars', content_length(a))
+        timer.set('to_chars', content_length(b))
+        profile_diff = get_setting('profile_slowest_diff', False)
+
+        def compute_diff():
+            started = False
+            profile = None
+            if profile_diff:
+                import cProfile
+                profile = cProfile.Profile()
+                profile.enable()
+            highlighter = None
+            if intraline_mode:
+                highlighter = IntralineHighlighter(intraline_mode,
+                    max_line_length=get_setting('intraline_max_line_length', 1000),
+                    max_pairs=get_setting('intraline_max_pairs', 5000),
+                    time_budget=get_setting('intraline_time_budget', 500) / 1000.0)
+            try:
+                job.progress('hashing')
+                with timer.phase('cache'):
+                    cache_key = diff_cache.key(a, b, from_name, to_name, context_lines, fold, diff_algorithm, compact, normalization)
+                    diffs = diff_cache.get(cache_key)
+                timer.set('cached', diffs is not None)
+                if diffs is None:
+                    diffs = self.generate_diff(job, a, b, from_name, to_name, context_lines, diff_algorithm, compact, fold, normalization)
+                    record = []
+                    record_size = 0
+                else:
+                    record = None
+
+                chunk = []
+                chunk_folds = []
+                offset = 0
+                added = removed = hunks = 0
+                loop_start = time.time()
+                # generate_diff is lazy, so prep_content runs inside this loop
+                prep_seconds = timer.phases.get('prep_content', 0.0)
+                for line in diffs:
+                    marker = line[:1]
+                    if marker == '+':
+                        added += 1
+                    elif marker == '-':
+                        removed += 1
+                    elif marker == '@':
+                        hunks += 1
+
+                    if not started:
+                        started = True
+                        sublime.set_timeout(lambda: self.start_output(job, a, b, from_name, to_name, external_command, open_in_sublime, **options), 0)
+                        if not open_in_sublime:
+                            break
+
+                    chunk.append(line)
+                    if isinstance(line, diff_engine.Fold):
+                        # the placeholder, without its newline
+                        chunk_folds.append((offset, offset + len(line) - 1, line.lines))
+                    offset += len(line)
+                    if highlighter:
+                        highlighter.feed(line)
+                    if len(chunk) >= chunk_lines:
+                        job.send_chunk(''.join(chunk), highlighter and highlighter.take_regions(), chunk_folds)
+                        chunk = []
+                        chunk_folds = []
+
+                    if record is not None:
+                        record.append(line)
+                        record_size += len(line)
+                        # too large to be cached, stop keeping a copy
+                        if record_size > diff_cache.max_bytes:
+                            record = None
+
+                if highlighter:
+                    highlighter.flush()
+                if chunk or highlighter:
+                    job.send_chunk(''.join(chunk), highlighter and highlighter.take_regions(), chunk_folds)
+
+                loop_seconds = time.time() - loop_start - job.wait_seconds
+                loop_seconds -= timer.phases.get('prep_content', 0.0) - prep_seconds
+                if highlighter:
+                    timer.add('intraline', highlighter.spent)
+                    loop_seconds -= highlighter.spent
+                timer.add('diff', loop_seconds)
+                timer.set('hunks', hunks)
+                if record is not None and (open_in_sublime or not started):
+                    diff_cache.put_lines(cache_key, record)
+                if summary_key is not None and (open_in_sublime or not started):
+                    if len(diff_summaries) > 1000:
+                        diff_summaries.clear()
+                    # the '---' and '+++' header lines are not changes
+                    diff_summaries[summary_key] = (max(added - 1, 0), max(removed - 1, 0))
+            except diff_engine.DiffCancelled:
+                return
+            except Exception as e:
+                message = str(e)
+                sublime.set_timeout(lambda: job.fail(message), 0)
+                return
+            finally:
+                if profile is not None:
+                    profile.disable()
+
+            sublime.set_timeout(lambda: self.end_output(job, started, profile), 0)
+
+        job.start()
+        sublime.set_timeout_async(compute_diff, 0)
+
+    def run_multi_diff(self, names, texts, base=None, all_pairs=False, dedent=False):
+        """Diffs many inputs into one view: every pair of them with
+        `all_pairs`, or each of them against input `base`. Asks which, if
+        neither is given. The inputs are split, de-indented with `dedent`,
+        and interned once, and the pairs are diffed on a thread pool."""
+        if base is None and not all_pairs:
+            items = ['Compare all pairs'] + ['Compare each with {}'.format(name) for name in names]
+
+            def on_done(index):
+                if index == 0:
+                    self.run_multi_diff(names, texts, None, True, dedent)
+                elif index > 0:
+                    self.run_multi_diff(names, texts, index - 1, False, dedent)
+            self.view.window().show_quick_panel(items, on_done)
+            return
+
+        global current_job
+        if current_job is not None:
+            current_job.cancel()
+
+        context_lines = get_setting('context_lines', 3)
+        if context_lines == 'full':
+            context_lines = sys.maxsize
+        diff_algorithm = get_setting('diff_algorithm', 'difflib')
+        if diff_algorithm not in diff_engine.ALGORITHMS:
+            self.view.show_popup('Unknown diff_algorithm: {}'.format(diff_algorithm))
+            return
+
+        ignore_whitespace, ignore_case, ignore_blank_lines, ignore_eol = normalize_options()
+        try:
+            key = normalize.key_function(ignore_whitespace, ignore_case, ignore_eol)
+        except ValueError as e:
+            self.view.show_popup(str(e))
+            return
+
+        job = current_job = DiffJob(self.view)
+        timer = job.timer = DiffTimer(self.name())
+        timer.add('capture', self.capture_seconds)
+        self.capture_seconds = 0.0
+
+        def compute_diffs():
+            output = []
+            identical = []
+            try:
+                with timer.phase('prep_content'):
+                    inputs = multi_diff.prepare(names, texts, dedent, key)
+                job.check()
+                job.progress('diffing')
+                pairs = multi_diff.pairs(len(inputs), base)
+                with timer.phase('diff'):
+                    for (i, j), lines in multi_diff.diff_all(inputs, pairs, context_lines, diff_algorithm,
+                            ignore_blank_lines=ignore_blank_lines, check=job.check):
+                        if lines:
+                            output.extend(lines)
+                        else:
+                            identical.append('# {} and {} are identical\n'.format(names[i], names[j]))
+                timer.set('pairs', len(pairs))
+            except diff_engine.DiffCancelled:
+                return
+            except Exception as e:
+                message = str(e)
+                sublime.set_timeout(lambda: job.fail(message), 0)
+                return
+            sublime.set_timeout(lambda: self.end_multi_diff(job, len(pairs), output, identical), 0)
 
-        diffs = list(difflib.unified_diff(from_content, to_content, from_file, to_file, n=context_lines))
+        job.start()
+        sublime.set_timeout_async(compute_diffs, 0)
 
-        if not diffs:
+    def end_multi_diff(self, job, pair_count, output, identical):
+        if job.cancelled:
+            return
+        job.finish()
+        if not output:
             self.view.show_popup('No Difference')
-
         else:
-            external_command = external_diff_tool or get_setting('cmd')
-            open_in_sublime = get_setting('open_in_sublime', not external_command)
+            header = ['# {} pairs compared, {} identical\n'.format(pair_count, len(identical))] + identical + ['\n']
+            with job.timer.phase('render'):
+                self.diff_in_sublime(header + output)
+
+        job.timer.finish()
+        if get_setting('collect_timings', False):
+            profiler.resize(get_setting('timings_history', 200))
+            profiler.record(job.timer)
+
+    def too_large(self, a, b):
+        max_diff_size = get_setting('max_diff_size', 50) * 1024 * 1024
+        return bool(max_diff_size) and content_length(a) + content_length(b) > max_diff_size
+
+    def files_equal(self, from_file, to_file):
+        """Byte for byte comparison of two files on disk. Files too large to
+        diff here are not compared, since this runs on the UI thread; their
+        summary compares them on the async thread."""
+        max_diff_size = get_setting('max_diff_size', 50) * 1024 * 1024
+        if max_diff_size and os.path.getsize(from_file) + os.path.getsize(to_file) > max_diff_size:
+            return False
+        return content_cache.files_equal(from_file, to_file)
+
+    def offer_summary(self, a, b, from_file, to_file, **options):
+        """For inputs that are binary or too large to diff in Sublime Text,
+        offers a summary of them instead, or the external diff tool."""
+        reasons = ['{} is {}'.format(content.path, content.reason) for content in (a, b) if isinstance(content, SkippedFile)]
+        if not reasons:
+            reasons = ['too large to diff here']
+        items = [['Show a summary', '; '.join(reasons)]]
+        external_command = options.get('cmd') or get_setting('cmd')
+        if external_command:
+            items.append(['Open in {}'.format(os.path.basename(external_command[0])), ' '.join(external_command)])
 
-            if external_command:
+        def on_done(index):
+            if index == 0:
+                sublime.set_timeout_async(lambda: self.show_summary(a, b, from_file, to_file), 0)
+            elif index == 1:
                 self.diff_with_external(external_command, a, b, from_file, to_file, **options)
+        self.view.window().show_quick_panel(items, on_done)
+
+    def show_summary(self, a, b, from_file, to_file):
+        """Called on the async thread, since comparing large files takes a
+        while. Files on disk are compared byte for byte."""
+        if isinstance(a, SkippedFile) and isinstance(b, SkippedFile):
+            same = content_cache.files_equal(a.path, b.path)
+        elif isinstance(a, SkippedFile) or isinstance(b, SkippedFile):
+            same = False
+        else:
+            same = same_content(a, b)
+
+        def describe(content):
+            if isinstance(content, SkippedFile):
+                return '{} bytes, {}'.format(content.size, content.reason)
+            return '{} characters'.format(content_length(content))
+        summary = '--- {} ({})\n+++ {} ({})\n{}\n'.format(
+            from_file, describe(a), to_file, describe(b), 'Files are identical' if same else 'Files differ')
+        sublime.set_timeout(lambda: self.diff_in_sublime([summary]), 0)
+
+    def generate_diff(self, job, a, b, from_file, to_file, context_lines, diff_algorithm, compact, fold=None, normalization=(None, False, False, False)):
+        """Diff lines, each ending with a newline, for the async thread."""
+        ignore_whitespace, ignore_case, ignore_blank_lines, ignore_eol = normalization
+        with job.timer.phase('prep_content'):
+            (from_content, from_file) = self.prep_content(a, from_file, 'from_file')
+            (to_content, to_file) = self.prep_content(b, to_file, 'to_file')
+            # lines are matched on their normalized keys, but shown as they are
+            key = normalize.key_function(ignore_whitespace, ignore_case, ignore_eol)
+            keys = None
+            if key is not None:
+                keys = (normalize.comparison_keys(from_content, key), normalize.comparison_keys(to_content, key))
+        job.timer.set('from_lines', len(from_content))
+        job.timer.set('to_lines', len(to_content))
+        job.check()
+
+        job.progress('diffing')
+        diffs = diff_engine.unified_diff(from_content, to_content, from_file, to_file, n=context_lines, algorithm=diff_algorithm, check=job.check, compact=compact, fold=fold,
+            keys=keys, ignore_blank_lines=ignore_blank_lines)
+        for line in diffs:
+            # fix diffs
+            if not line.endswith("\n"):
+                line += "\n"
+            yield line
+
+    def start_output(self, job, a, b, from_file, to_file, external_command, open_in_sublime, **options):
+        """Called with the first line of the diff, to open the external tool
+        and the scratch view that the rest of the diff is streamed into."""
+        if job.cancelled:
+            return
+
+        if external_command:
+            with job.timer.phase('external'):
+                self.diff_with_external(external_command, a, b, from_file, to_file, **options)
+            # files read for the external tool are not part of the next diff's capture
+            self.capture_seconds = 0.0
+
+        if open_in_sublime:
+            job.scratch = self.diff_in_sublime([])
+
+    def end_output(self, job, started, profile=None):
+        if job.cancelled:
+            return
+        job.finish()
+
+        if not started:
+            self.view.show_popup('No Difference')
 
-            if open_in_sublime:
-                # fix diffs
-                diffs = map(lambda line: (line and line[-1] == "\n") and line or line + "\n", diffs)
-                self.diff_in_sublime(diffs)
+        timer = job.timer
+        timer.finish()
+        if get_setting('collect_timings', False):
+            profiler.resize(get_setting('timings_history', 200))
+            profiler.record(timer)
+        if profile is not None and timer.total() > profiler.slowest_total:
+            import io
+            import pstats
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(25)
+            profiler.record_profile(timer, stream.getvalue())
+            profile_dir = os.path.join(sublime.cache_path(), 'FileDiffs')
+            if not os.path.isdir(profile_dir):
+                os.makedirs(profile_dir)
+            profile.dump_stats(os.path.join(profile_dir, 'slowest_diff.prof'))
 
     def diff_with_external(self, external_command, a, b, from_file=None, to_file=None, **options):
+        files_to_remove = []
         try:
             from_file_on_disk = self.file_will_be_read_from_disk(from_file)
             to_file_on_disk = self.file_will_be_read_from_disk(to_file)
@@ -145,84 +491,87 @@ class FileDiffCommand(sublime_plugin.TextCommand):
                 if os.path.exists(from_file) and view and view.is_dirty():
                     from_file_on_disk = True
 
-            files_to_remove = []
+            # external tools have options of their own for the other normalizations
+            trim = normalize_options()[0] == 'trailing'
+            line_ending = self.get_buffer_line_endings()
+            from_file = self.external_file(a, from_file, from_file_on_disk, trim, line_ending, files_to_remove)
+            to_file = self.external_file(b, to_file, to_file_on_disk, trim, line_ending, files_to_remove)
 
-            if not from_file_on_disk:
-                tmp_file = tempfile.NamedTemporaryFile(dir = sublime.packages_path(), prefix = "file-diffs-", suffix = ".temp", delete=False)
-                from_file = tmp_file.name
-                tmp_file.close()
-                files_to_remove.append(tmp_file.name)
-
-                with codecs.open(from_file, encoding='utf-8', mode='w+') as tmp_file:
-                    a_tmp = self.set_line_endings(a, self.get_buffer_line_endings())
-                    tmp_file.write(a_tmp)
-
-            if not to_file_on_disk:
-                tmp_file = tempfile.NamedTemporaryFile(dir = sublime.packages_path(), prefix = "file-diffs-", suffix = ".temp", delete=False)
-                to_file = tmp_file.name
-                tmp_file.close()
-                files_to_remove.append(tmp_file.name)
-
-                with codecs.open(to_file, encoding='utf-8', mode='w+') as tmp_file:
-                    b_tmp = self.set_line_endings(b, self.get_buffer_line_endings())
-                    tmp_file.write(b_tmp)
-
-            trim_trailing_white_space_before_diff = get_setting('trim_trailing_white_space_before_diff', False)
-            if trim_trailing_white_space_before_diff:
-                def trim_trailing_white_space(file_name):
-                    trim_lines = []
-                    modified = False
-                    with codecs.open(file_name, encoding='utf-8', mode='r') as f:
-                        lines = f.readlines()
-                        lines = [line.replace("\n", '').replace("\r", '') for line in lines]
-                        for line in lines:
-                            trim_line = line.rstrip()
-                            trim_lines.append(trim_line)
-                            if trim_line != line:
-                                modified = True
-                    if modified:
-                        tmp_file = tempfile.NamedTemporaryFile(dir = sublime.packages_path(), prefix = "file-diffs-", suffix = ".temp", delete=False)
-                        file_name = tmp_file.name
-                        tmp_file.close()
-                        files_to_remove.append(tmp_file.name)
-                        with codecs.open(file_name, encoding='utf-8', mode='w+') as f:
-                            f.writelines('\n'.join(trim_lines))
-                    return file_name
-
-                from_file = trim_trailing_white_space(from_file)
-                to_file = trim_trailing_white_space(to_file)
-
-            if os.path.exists(from_file):
-                external_command = [c.replace('$file1', from_file) for c in external_command]
-                external_command = [c.replace('$file2', to_file) for c in external_command]
-                external_command = [os.path.expandvars(c) for c in external_command]
-                if sublime.platform() == "windows":
-                    Popen(external_command)
-                else:
-                    subprocess.Popen(external_command)
-
-                apply_tempfile_changes_after_diff_tool = get_setting('apply_tempfile_changes_after_diff_tool', False)
-                post_diff_tool = options.get('post_diff_tool')
-                if apply_tempfile_changes_after_diff_tool and post_diff_tool is not None and (not from_file_on_disk or not to_file_on_disk):
-                    if from_file_on_disk:
-                        from_file = None
-                    if to_file_on_disk:
-                        to_file = None
-                    # Use a dialog to block st and wait for the closing of the diff tool
-                    if sublime.ok_cancel_dialog("Apply changes from tempfile after external diff tool execution?"):
-                        post_diff_tool(from_file, to_file)
+            if not os.path.exists(from_file):
+                return
+
+            external_command = [c.replace('$file1', from_file) for c in external_command]
+            external_command = [c.replace('$file2', to_file) for c in external_command]
+            external_command = [os.path.expandvars(c) for c in external_command]
+
+            watched = []
+            on_exit = None
+            apply_tempfile_changes_after_diff_tool = get_setting('apply_tempfile_changes_after_diff_tool', False)
+            post_diff_tool = options.get('post_diff_tool')
+            if apply_tempfile_changes_after_diff_tool and post_diff_tool is not None and (not from_file_on_disk or not to_file_on_disk):
+                from_tmp_file = None if from_file_on_disk else from_file
+                to_tmp_file = None if to_file_on_disk else to_file
+                watched = [from_tmp_file, to_tmp_file]
+
+                def on_exit(changed):
+                    if not changed:
+                        return
+                    from_content = changed.get(from_tmp_file)
+                    to_content = changed.get(to_tmp_file)
+
+                    def apply_changes():
+                        if sublime.ok_cancel_dialog("Apply changes from tempfile after external diff tool execution?"):
+                            post_diff_tool(from_content, to_content)
+                    sublime.set_timeout(apply_changes, 0)
+
+            diff_tools.max_running = get_setting('max_diff_tools', 4)
+            tool = DiffTool(external_command, files_to_remove, watched, on_exit)
+            # the tool owns the temp files from here on, and removes them when it exits
+            files_to_remove = []
+            if not diff_tools.launch(tool):
+                sublime.status_message('FileDiffs: too many diff tools open, waiting for one to close')
         except Exception as e:
             # some basic logging here, since we are cluttering the /tmp folder
             self.view.show_popup(str(e))
 
         finally:
-            def remove_files():
-                for file in files_to_remove:
+            for file in files_to_remove:
+                try:
                     os.remove(file)
+                except OSError:
+                    pass
+
+    def external_file(self, content, file_name, on_disk, trim, line_ending, files_to_remove):
+        """The file to hand to the external diff tool for one side of the diff.
+
+        Unmodified files on disk are passed through as they are. Everything
+        else is normalized in memory and written to a temp file just once.
+        """
+        if isinstance(content, SkippedFile):
+            return content.path
+        if on_disk:
+            if not trim:
+                return file_name
+            content = self.read_file(file_name)
+            # binary and too large files are not trimmed
+            if isinstance(content, SkippedFile) or not any(line.rstrip() != line.rstrip('\n') for line in content):
+                return file_name
+
+        if trim:
+            lines = content if isinstance(content, list) else content_cache.split_lines(content)
+            text = line_ending.join(line.rstrip() for line in lines)
+            if lines and lines[-1].endswith('\n'):
+                text += line_ending
+        else:
+            text = self.set_line_endings(content_text(content), line_ending)
 
-            # Remove temp files after 15 seconds. We don't remove immediately,
-            # because external diff tools may take some time to read them from disk.
-            sublime.set_timeout_async(remove_files, 15000)
+        import codecs
+        import tempfile
+        fd, tmp_file_name = tempfile.mkstemp(dir=temp_dir(), prefix="file-diffs-", suffix=".temp")
+        files_to_remove.append(tmp_file_name)
+        with codecs.open(fd, encoding='utf-8', mode='w') as tmp_file:
+            tmp_file.write(text)
+        return tmp_file_name
 
     def diff_in_sublime(self, diffs):
         diffs = ''.join(diffs)
@@ -233,14 +582,28 @@ class FileDiffCommand(sublime_plugin.TextCommand):
         scratches.add(scratch.id())
         scratch.set_scratch(True)
         scratch.set_syntax_file('Packages/Diff/Diff.tmLanguage')
-        scratch.run_command('file_diff_dummy1', {'content': diffs})
+        if diffs:
+            scratch.run_command('file_diff_dummy1', {'content': diffs})
         do_not_record = False
+        return scratch
 
     def read_file(self, file_name):
-        content = ''
-        with codecs.open(file_name, mode='U', encoding='utf-8') as f:
-            content = f.read()
-        return content
+        """The normalized lines of a file on disk. These are cached until the
+        file changes, and must not be modified. Binary files, and files over
+        the `max_diff_size` setting, are not read: a SkippedFile stands in
+        for them."""
+        start = time.time()
+        size = os.path.getsize(file_name)
+        max_diff_size = get_setting('max_diff_size', 50) * 1024 * 1024
+        if max_diff_size and size > max_diff_size:
+            return SkippedFile(file_name, size, 'too large')
+        file_cache.max_bytes = get_setting('content_cache_size', 64) * 1024 * 1024
+        try:
+            lines = file_cache.get_lines(file_name)
+        except content_cache.BinaryFileError:
+            return SkippedFile(file_name, size, 'binary')
+        self.capture_seconds += time.time() - start
+        return lines
 
     def get_file_name(self, view, default_name):
         file_name = ''
@@ -252,15 +615,10 @@ class FileDiffCommand(sublime_plugin.TextCommand):
             file_name = default_name
         return file_name
 
-    def get_content_from_file(self, file_name):
-        with codecs.open(file_name, encoding='utf-8', mode='r') as f:
-            lines = f.readlines()
-            lines = [line.replace("\r\n", "\n").replace("\r", "\n") for line in lines]
-            content = ''.join(lines)
-            return content
-
-    def update_view(self, view, edit, tmp_file):
-        if tmp_file:
+    def update_view(self, view, content):
+        """Replace the diffed text of `view` with `content`, the text of a
+        temp file that was changed in the external diff tool."""
+        if content is not None:
             non_empty_regions = [region for region in view.sel() if not region.empty()]
             nb_non_empty_regions = len(non_empty_regions)
             region = None
@@ -271,7 +629,7 @@ class FileDiffCommand(sublime_plugin.TextCommand):
             else:
                 self.view.show_popup('Cannot update multiselection')
                 return
-            view.replace(edit, region, self.get_content_from_file(tmp_file))
+            view.run_command('file_diff_replace', {'begin': region.begin(), 'end': region.end(), 'content': content})
 
     def file_will_be_read_from_disk(self, file):
         view = self.view.window().find_open_file(file)
@@ -287,6 +645,202 @@ class FileDiffDummy1Command(sublime_plugin.TextCommand):
         self.view.insert(edit, 0, content)
 
 
+class FileDiffAppendCommand(sublime_plugin.TextCommand):
+    def run(self, edit, content):
+        self.view.insert(edit, self.view.size(), content)
+
+
+class FileDiffReplaceCommand(sublime_plugin.TextCommand):
+    def run(self, edit, begin, end, content):
+        self.view.replace(edit, sublime.Region(begin, end), content)
+
+
+class DiffJob(object):
+    """A diff that is being computed on the async thread.
+
+    Shows progress in the status bar of the view that started it, or with
+    `window.status_message` when it was started without a view, and can be
+    cancelled; the worker calls `check()` regularly, which raises once the job
+    has been cancelled.
+
+    The diff output is streamed into `scratch` in chunks. Only a couple of
+    chunks are allowed in flight at once, so the worker never gets far ahead
+    of the view and memory use stays proportional to the chunk size.
+    """
+    STATUS_KEY = 'file_diffs'
+    SPINNER = ['[=   ]', '[ =  ]', '[  = ]', '[   =]', '[  = ]', '[ =  ]']
+    CHUNKS_IN_FLIGHT = 2
+
+    def __init__(self, view, window=None):
+        self.view = view
+        self.window = window
+        self.scratch = None
+        self.message = 'preparing'
+        self.cancelled = False
+        self.done = False
+        self.ticks = 0
+        self.rendered_lines = 0
+        self.region_sets = 0
+        self.timer = None
+        self.wait_seconds = 0.0
+        self.chunk_slots = threading.Semaphore(self.CHUNKS_IN_FLIGHT)
+
+    def start(self):
+        self.update_status()
+
+    def progress(self, message):
+        self.message = message
+
+    def check(self):
+        if self.cancelled:
+            raise diff_engine.DiffCancelled()
+
+    def send_chunk(self, content, regions=None, folds=None):
+        """Called from the worker; blocks until the view has caught up.
+        `regions` are the intra-line (deleted, inserted) changes found so far,
+        `folds` the (begin, end, lines) of the fold placeholders in `content`."""
+        start = time.time()
+        while not self.chunk_slots.acquire(timeout=0.1):
+            self.check()
+        self.wait_seconds += time.time() - start
+        self.check()
+        sublime.set_timeout(lambda: self.append_chunk(content, regions, folds), 0)
+
+    def append_chunk(self, content, regions=None, folds=None):
+        try:
+            if self.cancelled or self.scratch is None:
+                return
+            if self.scratch.id() not in scratches:
+                # the diff view was closed before it was complete
+                self.cancel()
+                return
+            with self.timer.phase('render'):
+                self.scratch.run_command('file_diff_append', {'content': content})
+                self.rendered_lines += content.count('\n')
+                if regions and (regions[0] or regions[1]):
+                    self.add_intraline_regions(*regions)
+                if folds:
+                    self.add_folds(folds)
+            self.progress('rendering ({} lines)'.format(self.rendered_lines))
+        finally:
+            self.chunk_slots.release()
+
+    def add_intraline_regions(self, deleted, inserted):
+        # every chunk gets its own keys, so earlier regions are never re-added
+        self.region_sets += 1
+        self.scratch.add_regions('file_diffs_intraline_deleted_{}'.format(self.region_sets),
+            [sublime.Region(begin, end) for begin, end in deleted], 'markup.deleted.diff', '', sublime.DRAW_NO_OUTLINE)
+        self.scratch.add_regions('file_diffs_intraline_inserted_{}'.format(self.region_sets),
+            [sublime.Region(begin, end) for begin, end in inserted], 'markup.inserted.diff', '', sublime.DRAW_NO_OUTLINE)
+
+    def add_folds(self, folds):
+        regions = self.scratch.get_regions(FOLDS_KEY)
+        regions.extend(sublime.Region(begin, end) for begin, end, lines in folds)
+        self.scratch.add_regions(FOLDS_KEY, regions, '', '', sublime.HIDDEN)
+        fold_lines.setdefault(self.scratch.id(), []).extend(lines for begin, end, lines in folds)
+
+    def cancel(self):
+        self.cancelled = True
+        self.finish()
+        sublime.status_message('FileDiffs: diff cancelled')
+
+    def fail(self, message):
+        if not self.cancelled:
+            self.finish()
+            if self.view is not None:
+                self.view.show_popup(message)
+            else:
+                sublime.error_message('FileDiffs: {}'.format(message))
+
+    def finish(self):
+        global current_job
+        self.done = True
+        if self.view is not None:
+            self.view.erase_status(self.STATUS_KEY)
+        if current_job is self:
+            current_job = None
+
+    def update_status(self):
+        if self.done:
+            return
+        spinner = self.SPINNER[self.ticks % len(self.SPINNER)]
+        self.ticks += 1
+        status = 'FileDiffs: {} {}'.format(self.message, spinner)
+        if self.view is not None:
+            self.view.set_status(self.STATUS_KEY, status)
+        else:
+            self.window.status_message(status)
+        sublime.set_timeout(self.update_status, 100)
+
+
+class FileDiffExpandFoldCommand(sublime_plugin.TextCommand):
+    """Replaces the fold placeholders under the cursors, or all of them, in
+    a folded full context diff with the unchanged lines they stand for."""
+    def run(self, edit, all=False):
+        regions = self.view.get_regions(FOLDS_KEY)
+        lines = fold_lines.get(self.view.id(), [])
+        if len(regions) != len(lines):
+            # the placeholders were edited away
+            return
+        if all:
+            expand = set(range(len(regions)))
+        else:
+            expand = set(index for index, region in enumerate(regions) if fold_under_cursor(self.view, region))
+
+        # from the end, so the earlier regions stay where they are
+        texts = {}
+        for index in sorted(expand, reverse=True):
+            text = ''.join(' ' + line if line.endswith('\n') else ' ' + line + '\n' for line in lines[index])
+            texts[index] = text[:-1]
+            self.view.replace(edit, regions[index], texts[index])
+
+        remaining = []
+        remaining_lines = []
+        shift = 0
+        for index, region in enumerate(regions):
+            if index in texts:
+                shift += len(texts[index]) - region.size()
+            else:
+                remaining.append(sublime.Region(region.a + shift, region.b + shift))
+                remaining_lines.append(lines[index])
+        self.view.add_regions(FOLDS_KEY, remaining, '', '', sublime.HIDDEN)
+        fold_lines[self.view.id()] = remaining_lines
+
+    def is_enabled(self, all=False):
+        return bool(fold_lines.get(self.view.id()))
+
+
+def fold_under_cursor(view, region):
+    return any(view.line(region).contains(selection.begin()) for selection in view.sel())
+
+
+FOLDS_KEY = 'file_diffs_folds'
+
+
+class FileDiffStatsCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        report = profiler.report()
+        if not get_setting('collect_timings', False):
+            report = 'Set "collect_timings": true in the FileDiffs settings to time diffs.\n\n' + report
+        global do_not_record
+        do_not_record = True
+        scratch = self.view.window().new_file()
+        scratches.add(scratch.id())
+        scratch.set_scratch(True)
+        scratch.set_name('FileDiffs Stats')
+        scratch.run_command('file_diff_dummy1', {'content': report})
+        do_not_record = False
+
+
+class FileDiffCancelCommand(sublime_plugin.TextCommand):
+    def run(self, edit):
+        if current_job is not None:
+            current_job.cancel()
+
+    def is_enabled(self):
+        return current_job is not None
+
+
 class FileDiffClipboardCommand(FileDiffCommand):
     def run(self, edit, **kwargs):
         to_file = self.get_file_name(self.view, 'untitled')
@@ -295,9 +849,10 @@ class FileDiffClipboardCommand(FileDiffCommand):
                 to_file += ' (Selection)'
                 break
         clipboard = sublime.get_clipboard()
-        def on_post_diff_tool(from_file, to_file):
-            self.update_view(self.view, edit, to_file)
-            sublime.set_clipboard(self.get_content_from_file(from_file))
+        def on_post_diff_tool(from_content, to_content):
+            self.update_view(self.view, to_content)
+            if from_content is not None:
+                sublime.set_clipboard(from_content)
 
         reverse = kwargs.get('reverse') or get_setting('reverse_clipboard', False)
         kwargs.update({'post_diff_tool': on_post_diff_tool, 'reverse': reverse})
@@ -314,43 +869,19 @@ class FileDiffClipboardCommand(FileDiffCommand):
 
 
 class FileDiffSelectionsCommand(FileDiffCommand):
-    def trim_indent(self, lines):
-        indent = None
-        for line in lines:
-            # ignore blank lines
-            if not line:
-                continue
-
-            new_indent = re.match('[ \t]*', line).group(0)
-            # ignore lines that only consist of whitespace
-            if len(new_indent) == len(line):
-                continue
-
-            if indent is None:
-                indent = new_indent
-            elif len(new_indent) < len(indent):
-                indent = new_indent
-
-            if not indent:
-                break
-        return indent
-
-    def run(self, edit, **kwargs):
-        regions = self.view.sel()
-        first_selection = self.view.substr(regions[0])
-        second_selection = self.view.substr(regions[1])
-
-        # trim off indent
-        indent = self.trim_indent(first_selection.splitlines())
-        if indent:
-            first_selection = "\n".join(line[len(indent):] for line in first_selection.splitlines())
-
-        # trim off indent
-        indent = self.trim_indent(second_selection.splitlines())
-        if indent:
-            second_selection = "\n".join(line[len(indent):] for line in second_selection.splitlines())
-
-        self.run_diff(first_selection, second_selection,
+    def run(self, edit, base=None, all_pairs=False, **kwargs):
+        regions = [region for region in self.view.sel() if not region.empty()]
+        if len(regions) < 2:
+            regions = list(self.view.sel())
+        texts = [self.view.substr(region) for region in regions]
+        names = ['selection {}'.format(index + 1) for index in range(len(texts))]
+        if len(texts) > 2:
+            self.run_multi_diff(names, texts, base, all_pairs, dedent=True)
+            return
+
+        # split and de-indent each selection just once
+        first, second = [multi_diff.dedent_lines(content_cache.split_lines(text)) for text in texts[:2]]
+        self.run_diff(first, second,
             from_file='first selection',
             to_file='second selection',
             **kwargs)
@@ -361,10 +892,33 @@ class FileDiffSelectionsCommand(FileDiffCommand):
         return len(self.view.sel()) > 1
 
 
+class FileDiffTabsCommand(FileDiffCommand):
+    """Compares the selected tabs, or all tabs of the current group, with
+    each other or with one of them."""
+    def run(self, edit, base=None, all_pairs=False, **kwargs):
+        window = self.view.window()
+        views = []
+        if hasattr(window, 'selected_sheets'):
+            views = [sheet.view() for sheet in window.selected_sheets() if sheet.view()]
+        if len(views) < 2:
+            views = window.views_in_group(window.active_group())
+        if len(views) < 2:
+            self.view.show_popup('Open at least two tabs to compare')
+            return
+        names = [self.get_file_name(view, 'untitled {}'.format(index + 1)) for index, view in enumerate(views)]
+        self.run_multi_diff(names, [self.diff_content(view) for view in views], base, all_pairs)
+
+    def is_visible(self, **kwargs):
+        if not get_setting('show_context_menu', True):
+            return False
+        window = self.view.window()
+        return window is not None and len(window.views()) > 1
+
+
 class FileDiffSavedCommand(FileDiffCommand):
     def run(self, edit, **kwargs):
-        def on_post_diff_tool(from_file, to_file):
-            self.update_view(self.view, edit, to_file)
+        def on_post_diff_tool(from_content, to_content):
+            self.update_view(self.view, to_content)
 
         kwargs.update({'post_diff_tool': on_post_diff_tool})
         self.run_diff(self.read_file(self.view.file_name()), self.diff_content(self.view),
@@ -382,7 +936,6 @@ class FileDiffFileCommand(FileDiffCommand):
     def run(self, edit, **kwargs):
         common = None
         folders = self.view.window().folders()
-        files = self.find_files(folders, [])
         for folder in folders:
             if common is None:
                 common = folder
@@ -393,60 +946,218 @@ class FileDiffFileCommand(FileDiffCommand):
                     common = common[0:common_len]
 
         my_file = self.view.file_name()
-        # filter out my_file
-        files = [f for f in files if f != my_file]
-        # shorten names using common length
-        file_picker = [f[len(common):] for f in files]
+        indexes = [project_file_index(self.view, folder) for folder in folders]
+
+        def show_files():
+            files = []
+            for index in indexes:
+                files.extend(index.files)
+            # filter out my_file
+            files = [f for f in files if f != my_file]
+            max_files = get_setting('limit')
+            if max_files and len(files) > max_files:
+                self.view.show_popup('Too many files to include all of them in this list')
+                files = files[:max_files]
+            # shorten names using common length
+            file_picker = [f[len(common):] for f in files]
+
+            def on_done(index):
+                if index > -1:
+                    if my_file and not self.view.is_dirty() and all(region.empty() for region in self.view.sel()) \
+                            and os.path.isfile(my_file) and self.files_equal(my_file, files[index]):
+                        # both are on disk, so the bytes can be compared without decoding
+                        self.view.show_popup('No Difference')
+                        return
+                    self.run_diff(self.diff_content(self.view), self.read_file(files[index]),
+                        from_file=self.view.file_name(),
+                        to_file=files[index],
+                        **kwargs)
+            self.view.window().show_quick_panel(file_picker, on_done)
+
+        def refresh_indexes():
+            # only directories that changed since the index was built are listed again
+            for index in indexes:
+                index.refresh()
+            sublime.set_timeout(show_files, 1)
+
+        sublime.set_timeout_async(refresh_indexes, 0)
+
+    def find_files(self, folders):
+        files = []
+        for folder in folders:
+            if not os.path.isdir(folder):
+                continue
+            index = project_file_index(self.view, folder)
+            index.refresh()
+            files.extend(index.files)
+        return files
 
-        def on_done(index):
-            if index > -1:
-                self.run_diff(self.diff_content(self.view), self.read_file(files[index]),
-                    from_file=self.view.file_name(),
-                    to_file=files[index],
-                    **kwargs)
-        sublime.set_timeout(lambda: self.view.window().show_quick_panel(file_picker, on_done), 1)
+    def is_visible(self, **kwargs):
+        return get_setting('show_context_menu', True)
 
-    def find_files(self, folders, ret=[]):
-        # Cannot access these settings!!  WHY!?
-        # folder_exclude_patterns = self.view.get_setting('folder_exclude_patterns')
-        # file_exclude_patterns = self.view.get_setting('file_exclude_patterns')
-        folder_exclude_patterns = [".svn", ".git", ".hg", "CVS"]
-        file_exclude_patterns = ["*.pyc", "*.pyo", "*.exe", "*.dll", "*.obj", "*.o", "*.a", "*.lib", "*.so", "*.dylib", "*.ncb", "*.sdf", "*.suo", "*.pdb", "*.idb", ".DS_Store", "*.class", "*.psd", "*.db"]
-        max_files = get_setting('limit', 1000)
 
-        for folder in folders:
+def project_file_index(view, folder):
+    """The file index of a project folder, using the same folder and file
+    exclude patterns as the side bar."""
+    settings = view.settings()
+    folder_exclude_patterns = list(settings.get('folder_exclude_patterns') or DEFAULT_FOLDER_EXCLUDE_PATTERNS)
+    file_exclude_patterns = list(settings.get('file_exclude_patterns') or DEFAULT_FILE_EXCLUDE_PATTERNS)
+
+    window = view.window()
+    project_data = window and window.project_data() or {}
+    project_file_name = window and window.project_file_name()
+    project_dir = project_file_name and os.path.dirname(project_file_name) or ''
+    for project_folder in project_data.get('folders', []):
+        path = os.path.normpath(os.path.join(project_dir, os.path.expanduser(project_folder.get('path', ''))))
+        if path == os.path.normpath(folder):
+            folder_exclude_patterns.extend(project_folder.get('folder_exclude_patterns', []))
+            file_exclude_patterns.extend(project_folder.get('file_exclude_patterns', []))
+
+    return file_index.get_index(folder, folder_exclude_patterns, file_exclude_patterns)
+
+
+class FileDiffFolderCommand(sublime_plugin.WindowCommand):
+    """Compares two folders, and lists the files that differ in a summary
+    view. `file_diff_folder_entry` opens the diff of an entry."""
+    STATUS_NAMES = {'M': 'modified', 'A': 'added', 'D': 'removed', 'B': 'binary', 'E': 'unreadable'}
+
+    def run(self, dirs=None):
+        dirs = list(dirs or [])
+        if len(dirs) >= 2:
+            self.compare(dirs[0], dirs[1])
+        elif dirs:
+            self.ask('Diff folder with folder:', dirs[0], lambda right: self.compare(dirs[0], right))
+        else:
+            folders = self.window.folders()
+            self.ask('Diff folder:', folders[0] if folders else '',
+                lambda left: self.ask('With folder:', left, lambda right: self.compare(left, right)))
+
+    def ask(self, caption, initial, on_done):
+        self.window.show_input_panel(caption, initial, on_done, None, None)
+
+    def compare(self, left, right):
+        left = os.path.normpath(os.path.expanduser(left))
+        right = os.path.normpath(os.path.expanduser(right))
+        for folder in (left, right):
             if not os.path.isdir(folder):
+                sublime.error_message('FileDiffs: {} is not a folder'.format(folder))
+                return
+
+        # without an active view, progress goes to the window's status message
+        view = self.window.active_view()
+        settings = view.settings() if view is not None else sublime.load_settings('Preferences.sublime-settings')
+        folder_exclude_patterns = settings.get('folder_exclude_patterns') or DEFAULT_FOLDER_EXCLUDE_PATTERNS
+        file_exclude_patterns = settings.get('file_exclude_patterns') or DEFAULT_FILE_EXCLUDE_PATTERNS
+        context_lines = get_setting('context_lines', 3)
+        if context_lines == 'full':
+            context_lines = sys.maxsize
+        diff_algorithm = get_setting('diff_algorithm', 'difflib')
+        if diff_algorithm not in diff_engine.ALGORITHMS:
+            diff_algorithm = 'difflib'
+        # a process pool needs a real Python interpreter to start its workers,
+        # which the plugin host is not
+        use_processes = get_setting('folder_diff_processes', False) and os.path.basename(sys.executable).startswith('python')
+
+        global current_job
+        if current_job is not None:
+            current_job.cancel()
+        job = current_job = DiffJob(view, self.window)
+        job.timer = DiffTimer(self.name())
+
+        def compare_trees():
+            try:
+                with job.timer.phase('diff'):
+                    result = folder_diff.compare_trees(left, right, folder_exclude_patterns, file_exclude_patterns,
+                        context_lines=context_lines, algorithm=diff_algorithm,
+                        workers=get_setting('folder_diff_workers') or None, use_processes=use_processes,
+                        check=job.check, progress=job.progress)
+            except diff_engine.DiffCancelled:
+                return
+            except Exception as e:
+                message = str(e)
+                sublime.set_timeout(lambda: job.fail(message), 0)
+                return
+            sublime.set_timeout(lambda: self.show_summary(job, result), 0)
+
+        job.start()
+        sublime.set_timeout_async(compare_trees, 0)
+
+    def show_summary(self, job, result):
+        if job.cancelled:
+            return
+        job.finish()
+        job.timer.finish()
+        if get_setting('collect_timings', False):
+            profiler.resize(get_setting('timings_history', 200))
+            profiler.record(job.timer)
+
+        counts = result.counts()
+        lines = [
+            '--- {}'.format(result.left),
+            '+++ {}'.format(result.right),
+            ', '.join('{} {}'.format(counts[status], self.STATUS_NAMES[status]) for status in 'MADBE')
+                + ', {} identical'.format(result.identical),
+            '',
+        ]
+        for status, name, added, removed in result.entries:
+            if status == 'M':
+                lines.append('{}  {}\t+{} -{}'.format(status, name, added, removed))
+            else:
+                lines.append('{}  {}'.format(status, name))
+
+        global do_not_record
+        do_not_record = True
+        scratch = self.window.new_file()
+        scratches.add(scratch.id())
+        scratch.set_scratch(True)
+        scratch.set_name('Folder Diff: {} - {}'.format(os.path.basename(result.left), os.path.basename(result.right)))
+        scratch.settings().set('file_diffs_folders', [result.left, result.right])
+        scratch.settings().set('file_diffs_folder_summary', True)
+        scratch.run_command('file_diff_dummy1', {'content': '\n'.join(lines) + '\n'})
+        do_not_record = False
+
+
+class FileDiffFolderEntryCommand(FileDiffCommand):
+    """Opens the diff of the entries under the cursors of a folder summary."""
+    def run(self, edit, **kwargs):
+        left, right = self.view.settings().get('file_diffs_folders')
+        for region in self.view.sel():
+            line = self.view.substr(self.view.line(region))
+            if line[1:3] != '  ' or line[:1] not in FileDiffFolderCommand.STATUS_NAMES:
                 continue
+            name = line[3:].split('\t')[0]
+            from_file = os.path.join(left, name)
+            to_file = os.path.join(right, name)
+            if os.path.isfile(from_file) and os.path.isfile(to_file) and self.files_equal(from_file, to_file):
+                self.view.show_popup('No Difference')
+                break
+            a = self.read_file(from_file) if os.path.isfile(from_file) else ''
+            b = self.read_file(to_file) if os.path.isfile(to_file) else ''
+            self.run_diff(a, b, from_file=from_file, to_file=to_file, **kwargs)
+            # only one diff runs at a time
+            break
 
-            for f in os.listdir(folder):
-                fullpath = os.path.join(folder, f)
-                if os.path.isdir(fullpath):
-                    # excluded folder?
-                    if not len([True for pattern in folder_exclude_patterns if fnmatch(f, pattern)]):
-                        self.find_files([fullpath], ret)
-                else:
-                    # excluded file?
-                    if not len([True for pattern in file_exclude_patterns if fnmatch(f, pattern)]):
-                        ret.append(fullpath)
-                if len(ret) >= max_files:
-                    self.view.show_popup('Too many files to include all of them in this list')
-                    return ret
-        return ret
+    def is_enabled(self, **kwargs):
+        return bool(self.view.settings().get('file_diffs_folders'))
 
     def is_visible(self, **kwargs):
-        return get_setting('show_context_menu', True)
+        return self.is_enabled()
+
+
+DEFAULT_FOLDER_EXCLUDE_PATTERNS = [".svn", ".git", ".hg", "CVS"]
+DEFAULT_FILE_EXCLUDE_PATTERNS = ["*.pyc", "*.pyo", "*.exe", "*.dll", "*.obj", "*.o", "*.a", "*.lib", "*.so", "*.dylib", "*.ncb", "*.sdf", "*.suo", "*.pdb", "*.idb", ".DS_Store", "*.class", "*.psd", "*.db"]
 
 
 class FileDiffTabCommand(FileDiffCommand):
     def run(self, edit, **kwargs):
         my_id = self.view.id()
         files = []
-        contents = []
         views = []
         untitled_count = 1
+        # only names and sizes are needed for the panel, the content of the
+        # chosen tab is captured in on_done
         for v in self.view.window().views():
             if v.id() != my_id:
-                this_content = v.substr(sublime.Region(0, v.size()))
                 if v.file_name():
                     files.append(v.file_name())
                 elif v.name():
@@ -455,17 +1166,19 @@ class FileDiffTabCommand(FileDiffCommand):
                     files.append('untitled %d' % untitled_count)
                     untitled_count += 1
 
-                contents.append(this_content)
                 views.append(v)
 
         def on_done(index):
             if index > -1:
-                def on_post_diff_tool(from_file, to_file):
-                    self.update_view(self.view, edit, from_file)
-                    self.update_view(views[index], edit, to_file)
-
-                kwargs.update({'post_diff_tool': on_post_diff_tool})
-                self.run_diff(self.diff_content(self.view), contents[index],
+                def on_post_diff_tool(from_content, to_content):
+                    self.update_view(self.view, from_content)
+                    self.update_view(views[index], to_content)
+
+                kwargs.update({
+                    'post_diff_tool': on_post_diff_tool,
+                    'summary_key': (view_key(self.view), view_key(views[index], False)),
+                })
+                self.run_diff(self.diff_content(self.view), views[index].substr(sublime.Region(0, views[index].size())),
                     from_file=self.view.file_name(),
                     to_file=files[index],
                     **kwargs)
@@ -473,10 +1186,17 @@ class FileDiffTabCommand(FileDiffCommand):
         if len(files) == 1:
             on_done(0)
         else:
-            if get_setting('expand_full_file_name_in_tab', False):
-                menu_items = [[os.path.basename(f),f] for f in files]
-            else:
-                menu_items = [os.path.basename(f) for f in files]
+            expand_full_file_name_in_tab = get_setting('expand_full_file_name_in_tab', False)
+            my_key = view_key(self.view)
+            menu_items = []
+            for f, v in zip(files, views):
+                details = [format_size(v.size())]
+                summary = diff_summaries.get((my_key, view_key(v, False)))
+                if summary is not None:
+                    details.append('+{} -{}'.format(*summary) if any(summary) else 'no difference')
+                if expand_full_file_name_in_tab:
+                    details.insert(0, f)
+                menu_items.append([os.path.basename(f), ', '.join(details)])
             sublime.set_timeout(lambda: self.view.window().show_quick_panel(menu_items, on_done), 1)
 
     def is_visible(self):
@@ -485,18 +1205,48 @@ class FileDiffTabCommand(FileDiffCommand):
         return len(self.view.window().views()) > 1
 
 
+def view_key(view, with_selection=True):
+    """Identifies the content of a view cheaply, by its change count (and
+    selections, which `diff_content` diffs instead of the whole view)."""
+    selection = ()
+    if with_selection:
+        selection = tuple((region.a, region.b) for region in view.sel() if not region.empty())
+    return (view.id(), view.change_count(), selection)
+
+
+def format_size(size):
+    if size < 1000:
+        return '{} chars'.format(size)
+    if size < 1000000:
+        return '{:.1f}K chars'.format(size / 1000.0)
+    return '{:.1f}M chars'.format(size / 1000000.0)
+
+
 previous_view = current_view = None
+current_job = None
+file_cache = content_cache.ContentCache()
+diff_cache = DiffCache(16 * 1024 * 1024)
+diff_tools = DiffToolManager()
+profiler = Profiler()
+diff_summaries = {}
+live_diffs = {}
+live_diff_pending = {}
+fold_lines = {}
 do_not_record = False
 scratches = set()
+last_git_revision = 'HEAD'
 
 class FileDiffPreviousCommand(FileDiffCommand):
     def run(self, edit, **kwargs):
         if previous_view:
-            def on_post_diff_tool(from_file, to_file):
-                self.update_view(previous_view, edit, from_file)
-                self.update_view(current_view, edit, to_file)
-
-            kwargs.update({'post_diff_tool': on_post_diff_tool})
+            def on_post_diff_tool(from_content, to_content):
+                self.update_view(previous_view, from_content)
+                self.update_view(current_view, to_content)
+
+            kwargs.update({
+                'post_diff_tool': on_post_diff_tool,
+                'summary_key': (view_key(previous_view), view_key(self.view)),
+            })
             self.run_diff(self.diff_content(previous_view), self.diff_content(self.view),
                 from_file=self.get_file_name(previous_view, 'untitled (Previous)'),
                 to_file=self.get_file_name(self.view, 'untitled (Current)'),
@@ -507,6 +1257,54 @@ class FileDiffPreviousCommand(FileDiffCommand):
             return False
         return previous_view is not None
 
+class FileDiffGitCommand(FileDiffCommand):
+    """Diffs the current file or selection(s) with the file at a git
+    revision, by default HEAD. An empty revision means the staged version."""
+    def run(self, edit, revision=None, **kwargs):
+        if revision is not None:
+            self.diff_revision(revision, **kwargs)
+            return
+
+        def on_done(revision):
+            global last_git_revision
+            last_git_revision = revision.strip()
+            self.diff_revision(last_git_revision, **kwargs)
+        self.view.window().show_input_panel('Diff with Git revision:', last_git_revision, on_done, None, None)
+
+    def diff_revision(self, revision, **kwargs):
+        file_name = self.view.file_name()
+        content = self.diff_content(self.view)
+        repository = git_blobs.get_repository(file_name, get_setting('git_binary') or 'git')
+        if repository is None:
+            self.view.show_popup('{} is not in a git repository'.format(file_name))
+            return
+
+        def read_revision():
+            # on the async thread, so a slow repository doesn't block the UI;
+            # the cat-file processes and the blob cache make repeated reads cheap
+            start = time.time()
+            try:
+                lines = repository.get_lines(revision, file_name)
+            except (git_blobs.GitError, content_cache.BinaryFileError) as e:
+                message = str(e)
+                sublime.set_timeout(lambda: self.view.show_popup(message), 0)
+                return
+            self.capture_seconds += time.time() - start
+
+            def on_post_diff_tool(from_content, to_content):
+                self.update_view(self.view, to_content)
+
+            kwargs.update({'post_diff_tool': on_post_diff_tool})
+            from_file = '{}:{}'.format(revision or '(index)', repository.relative_path(file_name))
+            sublime.set_timeout(lambda: self.run_diff(lines, content, from_file=from_file, to_file=file_name, **kwargs), 0)
+        sublime.set_timeout_async(read_revision, 0)
+
+    def is_visible(self, **kwargs):
+        if not get_setting('show_context_menu', True):
+            return False
+        return bool(self.view.file_name()) and git_blobs.find_repository(self.view.file_name()) is not None
+
+
 def record_current_view(view):
     if do_not_record:
         return
@@ -530,18 +1328,195 @@ class FileDiffListener(sublime_plugin.EventListener):
         except AttributeError:
             pass
 
+        # build the project file indexes in the background, so that
+        # "Diff file with File in Project…" can open right away
+        window = view.window()
+        if window:
+            for folder in window.folders():
+                index = project_file_index(view, folder)
+                if not index.built:
+                    sublime.set_timeout_async(lambda index=index: index.refresh(wait=False), 0)
+
     def on_close(self, view):
         if view.id() in scratches:
             scratches.remove(view.id())
+        fold_lines.pop(view.id(), None)
+
+    def on_query_context(self, view, key, operator, operand, match_all):
+        if key != 'file_diffs_fold':
+            return None
+        regions = view.get_regions(FOLDS_KEY) if view.id() in fold_lines else []
+        on_fold = any(fold_under_cursor(view, region) for region in regions)
+        if operator == sublime.OP_NOT_EQUAL:
+            return on_fold != operand
+        return on_fold == operand
+
+
+class FileDiffLiveListener(sublime_plugin.EventListener):
+    """Keeps gutter markers of the unsaved changes in a file up to date, when
+    the `live_diff` setting is on."""
+    REGION_KEYS = ('file_diffs_added', 'file_diffs_modified', 'file_diffs_removed')
+
+    def on_activated(self, view):
+        if view.id() not in live_diffs:
+            self.schedule(view, 0)
+
+    def on_modified(self, view):
+        self.schedule(view, get_setting('live_diff_delay', 250))
+
+    def on_load(self, view):
+        self.reset(view)
+
+    def on_post_save(self, view):
+        self.reset(view)
+
+    def on_close(self, view):
+        live_diffs.pop(view.id(), None)
+        live_diff_pending.pop(view.id(), None)
+
+    def reset(self, view):
+        live_diffs.pop(view.id(), None)
+        self.schedule(view, 0)
+
+    def schedule(self, view, delay):
+        if not get_setting('live_diff', False):
+            return
+        if view.id() in scratches or not view.file_name():
+            return
+
+        # debounce: only the last edit in a burst of typing triggers a diff
+        pending = live_diff_pending.get(view.id(), 0) + 1
+        live_diff_pending[view.id()] = pending
+
+        def capture():
+            if live_diff_pending.get(view.id()) != pending:
+                return
+            file_name = view.file_name()
+            if not file_name or not os.path.exists(file_name):
+                for key in self.REGION_KEYS:
+                    view.erase_regions(key)
+                return
+            text = view.substr(sublime.Region(0, view.size()))
+            sublime.set_timeout_async(lambda: self.update(view, file_name, text, pending), 0)
+        sublime.set_timeout(capture, delay)
+
+    def update(self, view, file_name, text, pending):
+        def check():
+            # a newer edit will diff again, so this diff is not needed
+            if live_diff_pending.get(view.id()) != pending:
+                raise diff_engine.DiffCancelled()
+
+        buffer = content_cache.split_lines(text)
+        try:
+            live_diff = live_diffs.get(view.id())
+            if live_diff is None:
+                saved = file_cache.get_lines(file_name)
+                live_diff = live_diffs[view.id()] = LiveDiff(saved, buffer, check=check)
+            elif not live_diff.update(buffer, check):
+                return
+        except (IOError, OSError, content_cache.BinaryFileError, diff_engine.DiffCancelled):
+            return
+
+        added, modified, removed = live_diff.changes()
+        sublime.set_timeout(lambda: self.draw(view, added, modified, removed), 0)
+
+    def draw(self, view, added, modified, removed):
+        flags = sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE
+        if get_setting('live_diff_highlight_lines', False):
+            flags = sublime.DRAW_NO_OUTLINE
+
+        def line_regions(rows):
+            return [view.full_line(view.text_point(row, 0)) for row in rows]
+        view.add_regions('file_diffs_added', line_regions(added), 'markup.inserted', 'dot', flags)
+        view.add_regions('file_diffs_modified', line_regions(modified), 'markup.changed', 'dot', flags)
+        view.add_regions('file_diffs_removed', line_regions(removed), 'markup.deleted', 'circle', sublime.DRAW_NO_FILL | sublime.DRAW_NO_OUTLINE)
+
+
+def plugin_loaded():
+    for settings in settings_files():
+        settings.add_on_change('file_diffs_snapshot', settings_snapshot.clear)
+    settings_snapshot.clear()
+
+
+def plugin_unloaded():
+    for settings in settings_files():
+        settings.clear_on_change('file_diffs_snapshot')
+    settings_snapshot.clear()
+    git_blobs.close_all()
+
+
+def temp_dir():
+    """Where temp files for external diff tools go: the `temp_dir` setting, or
+    a memory backed tmpfs when there is one, or else the Packages folder
+    (rather than the system temp folder, which is a privacy concern for
+    portable installations)."""
+    path = get_setting('temp_dir')
+    if path:
+        return os.path.expanduser(os.path.expandvars(path))
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return sublime.packages_path()
+
+
+class SkippedFile(object):
+    """Stands in for the content of a file that was not read, because it is
+    binary or too large to diff."""
+    def __init__(self, path, size, reason):
+        self.path = path
+        self.size = size
+        self.reason = reason
+
+
+def same_content(a, b):
+    """Whether two diff inputs are the same text. Lengths are compared
+    first; the shared line lists of the content cache compare by identity."""
+    if a is b:
+        return True
+    if isinstance(a, list) == isinstance(b, list):
+        return len(a) == len(b) and a == b
+    return content_length(a) == content_length(b) and content_text(a) == content_text(b)
+
+
+def content_length(content):
+    """Length of a diff input, which is either text or a list of lines."""
+    if isinstance(content, list):
+        return sum(map(len, content))
+    return len(content)
+
+
+def content_text(content):
+    if isinstance(content, list):
+        return ''.join(content)
+    return content
+
+
+def normalize_options():
+    """The (ignore_whitespace, ignore_case, ignore_blank_lines, ignore_eol)
+    settings. The older trim_trailing_white_space_before_diff setting means
+    "ignore_whitespace": "trailing"."""
+    ignore_whitespace = get_setting('ignore_whitespace') or None
+    if ignore_whitespace is None and get_setting('trim_trailing_white_space_before_diff', False):
+        ignore_whitespace = 'trailing'
+    return (ignore_whitespace, bool(get_setting('ignore_case', False)),
+        bool(get_setting('ignore_blank_lines', False)), bool(get_setting('ignore_eol', False)))
+
+
+# merged values of the base and OS-specific settings, by key; cleared when
+# either file changes
+settings_snapshot = {}
+
+
+def settings_files():
+    """The base settings, and the OS-specific settings that override them."""
+    platform = {'windows': 'Windows', 'osx': 'OSX'}.get(sublime.platform(), 'Linux')
+    return (sublime.load_settings('FileDiffs.sublime-settings'),
+        sublime.load_settings('FileDiffs ({}).sublime-settings'.format(platform)))
 
 
 def get_setting(key, default=None):
-    settings = sublime.load_settings('FileDiffs.sublime-settings')
-    os_specific_settings = {}
-    if sublime.platform() == 'windows':
-        os_specific_settings = sublime.load_settings('FileDiffs (Windows).sublime-settings')
-    elif sublime.platform() == 'osx':
-        os_specific_settings = sublime.load_settings('FileDiffs (OSX).sublime-settings')
-    else:
-        os_specific_settings = sublime.load_settings('FileDiffs (Linux).sublime-settings')
-    return os_specific_settings.get(key, settings.get(key, default))
+    try:
+        value = settings_snapshot[key]
+    except KeyError:
+        settings, os_specific_settings = settings_files()
+        value = settings_snapshot[key] = os_specific_settings.get(key, settings.get(key))
+    return default if value is None else value
@@ -0,0 +1,98 @@
+# coding: utf8
+"""LRU cache of file contents, already split into normalized lines."""
+import mmap
+import os
+
+from .lru import LRUCache
+
+
+# rough per-line overhead of a str in a list, used to estimate memory use
+LINE_OVERHEAD = 56
+
+
+def split_lines(text):
+    """Normalize line endings to "\\n" and split, keeping the line endings."""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text.splitlines(True)
+
+
+class BinaryFileError(ValueError):
+    """Raised for files that are not text: they have a NUL byte near the
+    start, or are not valid utf-8."""
+
+
+# like git, only the start of a file is checked for NUL bytes
+BINARY_SNIFF_SIZE = 8000
+COMPARE_BLOCK_SIZE = 1024 * 1024
+
+
+def read_text(path, size=None, mmap_threshold=4 * 1024 * 1024):
+    """Decode a utf-8 file. Large files are decoded straight out of a memory
+    map, instead of being read into an intermediate bytes object first.
+    Raises BinaryFileError for binary files, before decoding them."""
+    with open(path, 'rb') as f:
+        if size is None:
+            size = os.fstat(f.fileno()).st_size
+        if size and size >= mmap_threshold:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return decode_text(mapped, path)
+            finally:
+                mapped.close()
+        return decode_text(f.read(), path)
+
+
+def decode_text(data, name):
+    """Decode utf-8 `data`, or raise BinaryFileError if it isn't text."""
+    if data.find(b'\0', 0, BINARY_SNIFF_SIZE) != -1:
+        raise BinaryFileError('{} is a binary file'.format(name))
+    try:
+        return str(data, 'utf-8')
+    except UnicodeDecodeError as e:
+        raise BinaryFileError('{} is not utf-8 text ({})'.format(name, e))
+
+
+def files_equal(left, right, block_size=COMPARE_BLOCK_SIZE):
+    """Whether two files have the same bytes. Sizes are compared first, and
+    the content in blocks, stopping at the first block that differs."""
+    left_stat = os.stat(left)
+    right_stat = os.stat(right)
+    if left_stat.st_size != right_stat.st_size:
+        return False
+    if os.path.samestat(left_stat, right_stat):
+        return True
+    with open(left, 'rb') as left_file, open(right, 'rb') as right_file:
+        while True:
+            left_block = left_file.read(block_size)
+            if left_block != right_file.read(block_size):
+                return False
+            if not left_block:
+                return True
+
+
+class ContentCache(LRUCache):
+    """Keeps the lines of recently read files, keyed on (path, mtime, size),
+    so that diffing against an unchanged file again skips the I/O and decode.
+
+    Least recently used entries are dropped once the estimated memory use
+    goes over `max_bytes`. The cached lists are shared, so callers must not
+    modify them.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, mmap_threshold=4 * 1024 * 1024):
+        super(ContentCache, self).__init__(max_bytes)
+        self.mmap_threshold = mmap_threshold
+
+    def get_lines(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        lines = self.get(key)
+        if lines is not None:
+            return lines
+
+        lines = split_lines(read_text(path, stat.st_size, self.mmap_threshold))
+        # an older version of the same file can't be asked for again
+        self.discard(lambda k: k[0] == path)
+        self.put(key, lines, stat.st_size + LINE_OVERHEAD * len(lines))
+        return lines
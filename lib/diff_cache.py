@@ -0,0 +1,26 @@
+# coding: utf8
+"""Memoized diff output, keyed on fingerprints of both inputs."""
+from .diff_engine import Fold
+from .lru import LRUCache
+
+
+def fingerprint(content):
+    """A cheap fingerprint of a diff input, which is either text or a list of
+    lines. The hash of a str is cached on the object, so fingerprinting the
+    shared line lists of the content cache again is nearly free."""
+    if isinstance(content, list):
+        return ('lines', len(content), hash(tuple(content)))
+    return ('text', len(content), hash(content))
+
+
+class DiffCache(LRUCache):
+    """The lines of previously computed diffs. An empty list means that
+    there was no difference."""
+    def key(self, a, b, *options):
+        return (fingerprint(a), fingerprint(b)) + options
+
+    def put_lines(self, key, lines):
+        # a fold placeholder keeps the unchanged lines it stands for alive
+        size = sum(map(len, lines)) + 64
+        size += sum(sum(map(len, line.lines)) for line in lines if isinstance(line, Fold))
+        return self.put(key, lines, size)
@@ -0,0 +1,570 @@
+# coding: utf8
+"""Line diff algorithms that produce difflib compatible unified diffs."""
+from array import array
+
+
+ALGORITHMS = ('difflib', 'myers', 'patience', 'histogram')
+
+# histogram diff falls back to myers when every candidate line is this common
+MAX_CHAIN_LENGTH = 64
+
+# once a myers search has gone this many edits, or the square root of the
+# number of lines if that is more, it gives up on an optimal path and splits
+# at the furthest point it reached, like git's xdiff
+MIN_MAX_COST = 256
+
+
+class DiffCancelled(Exception):
+    """Raised by a `check` callback to abandon a diff that is in progress."""
+
+
+class Fold(str):
+    """A placeholder line of a folded diff, standing for the run of unchanged
+    `lines` that it replaces."""
+    def __new__(cls, lines, lineterm='\n'):
+        fold = str.__new__(cls, ' ... {} unchanged lines ...{}'.format(len(lines), lineterm))
+        fold.lines = lines
+        return fold
+
+
+def unified_diff(a, b, fromfile='', tofile='', fromfiledate='', tofiledate='', n=3, lineterm='\n', algorithm='difflib', check=None, compact=False, fold=None,
+                 keys=None, ignore_blank_lines=False):
+    """Same output format as `difflib.unified_diff`, using `algorithm` to match lines.
+
+    `check` is called regularly while lines are matched, and can raise
+    `DiffCancelled` to stop the diff. With `compact`, the opcodes are computed
+    by `get_compact_opcodes`, which is meant for large, mostly similar inputs.
+    With `fold`, meant for full context diffs, unchanged runs are replaced by
+    a `Fold` line, keeping `fold` lines of context next to the changes.
+
+    With `keys`, a pair of lists with a comparison key for each line of `a`
+    and `b`, lines are matched on their keys but shown as they are. With
+    `ignore_blank_lines`, hunks that only add or remove blank lines are left
+    out.
+    """
+    a_keys, b_keys = keys if keys is not None else (a, b)
+    if compact:
+        opcodes = get_compact_opcodes(a_keys, b_keys, algorithm, check)
+    else:
+        opcodes = get_opcodes(a_keys, b_keys, algorithm, check)
+    groups = get_grouped_opcodes(opcodes, n)
+    if ignore_blank_lines:
+        groups = without_blank_changes(groups, a, b)
+    return format_unified(a, b, groups, fromfile, tofile, fromfiledate, tofiledate, lineterm, fold)
+
+
+def format_unified(a, b, groups, fromfile='', tofile='', fromfiledate='', tofiledate='', lineterm='\n', fold=None):
+    started = False
+    for group in groups:
+        if not started:
+            started = True
+            fromdate = '\t{}'.format(fromfiledate) if fromfiledate else ''
+            todate = '\t{}'.format(tofiledate) if tofiledate else ''
+            yield '--- {}{}{}'.format(fromfile, fromdate, lineterm)
+            yield '+++ {}{}{}'.format(tofile, todate, lineterm)
+
+        first, last = group[0], group[-1]
+        file1_range = _format_range_unified(first[1], last[2])
+        file2_range = _format_range_unified(first[3], last[4])
+        yield '@@ -{} +{} @@{}'.format(file1_range, file2_range, lineterm)
+
+        for index, (tag, i1, i2, j1, j2) in enumerate(group):
+            if tag == 'equal':
+                if fold is not None:
+                    # no context is needed before the first or after the last change
+                    head = fold if index else 0
+                    tail = fold if index < len(group) - 1 else 0
+                    if i2 - i1 - head - tail > 1:
+                        for line in a[i1:i1 + head]:
+                            yield ' ' + line
+                        yield Fold(a[i1 + head:i2 - tail], lineterm)
+                        for line in a[i2 - tail:i2]:
+                            yield ' ' + line
+                        continue
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+
+def _format_range_unified(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return '{}'.format(beginning)
+    if not length:
+        beginning -= 1
+    return '{},{}'.format(beginning, length)
+
+
+def sequence_matcher(a, b):
+    # difflib is only loaded when the "difflib" algorithm is used
+    import difflib
+    return difflib.SequenceMatcher(None, a, b)
+
+
+def get_opcodes(a, b, algorithm='difflib', check=None):
+    if algorithm == 'difflib':
+        return sequence_matcher(a, b).get_opcodes()
+    return opcodes_from_blocks(matching_blocks(a, b, algorithm, check))
+
+
+def get_compact_opcodes(a, b, algorithm='difflib', check=None):
+    """Opcodes for large inputs.
+
+    The identical leading and trailing runs of lines are skipped in one pass,
+    and only the lines in between are interned into compact int arrays, which
+    are what the algorithm actually diffs.
+    """
+    la, lb = len(a), len(b)
+    lo = 0
+    while lo < la and lo < lb and a[lo] == b[lo]:
+        lo += 1
+    ahi, bhi = la, lb
+    while ahi > lo and bhi > lo and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+
+    table = {}
+    setdefault = table.setdefault
+    ids_a = array('l', (setdefault(a[i], len(table)) for i in range(lo, ahi)))
+    ids_b = array('l', (setdefault(b[j], len(table)) for j in range(lo, bhi)))
+    table = None
+    if check:
+        check()
+
+    if algorithm == 'difflib':
+        middle = sequence_matcher(ids_a, ids_b).get_opcodes()
+    else:
+        middle = opcodes_from_blocks(match_ids(ids_a, ids_b, algorithm, check))
+
+    opcodes = []
+    if lo:
+        opcodes.append(('equal', 0, lo, 0, lo))
+    for tag, i1, i2, j1, j2 in middle:
+        if tag == 'equal' and opcodes and opcodes[-1][0] == 'equal':
+            opcodes[-1] = ('equal', opcodes[-1][1], lo + i2, opcodes[-1][3], lo + j2)
+        else:
+            opcodes.append((tag, lo + i1, lo + i2, lo + j1, lo + j2))
+    if ahi < la:
+        if opcodes and opcodes[-1][0] == 'equal':
+            opcodes[-1] = ('equal', opcodes[-1][1], la, opcodes[-1][3], lb)
+        else:
+            opcodes.append(('equal', ahi, la, bhi, lb))
+    return opcodes
+
+
+def get_grouped_opcodes(codes, n=3):
+    """Isolate change clusters, like `SequenceMatcher.get_grouped_opcodes`."""
+    codes = list(codes)
+    if not codes:
+        codes = [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    nn = n + n
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > nn:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def without_blank_changes(groups, a, b):
+    """The groups that change at least one line that is not blank."""
+    for group in groups:
+        for tag, i1, i2, j1, j2 in group:
+            if tag != 'equal' and (any(line.strip() for line in a[i1:i2]) or any(line.strip() for line in b[j1:j2])):
+                yield group
+                break
+
+
+def opcodes_from_blocks(blocks):
+    """Convert (i, j, n) matching blocks, ending with a (len(a), len(b), 0)
+    sentinel, into difflib style opcodes."""
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def matching_blocks(a, b, algorithm='myers', check=None):
+    if algorithm not in ALGORITHMS:
+        raise ValueError('Unknown diff_algorithm: {}'.format(algorithm))
+    if algorithm == 'difflib':
+        return sequence_matcher(a, b).get_matching_blocks()
+
+    a, b = intern_lines(a, b)
+    return match_ids(a, b, algorithm, check)
+
+
+def match_ids(a, b, algorithm='myers', check=None):
+    """`matching_blocks` for sequences that are already interned."""
+    blocks = []
+    if algorithm == 'myers':
+        _myers(a, b, 0, len(a), 0, len(b), blocks, check)
+    elif algorithm == 'patience':
+        _patience(a, b, 0, len(a), 0, len(b), blocks, check)
+    else:
+        _histogram(a, b, 0, len(a), 0, len(b), blocks, check)
+    return _merge_blocks(blocks, len(a), len(b))
+
+
+def intern_lines(a, b, table=None):
+    """Map every distinct line to a small int, so the algorithms below
+    compare ints instead of strings."""
+    if table is None:
+        table = {}
+    setdefault = table.setdefault
+    a = [setdefault(line, len(table)) for line in a]
+    b = [setdefault(line, len(table)) for line in b]
+    return a, b
+
+
+def _merge_blocks(blocks, la, lb):
+    blocks.sort()
+    merged = []
+    for i, j, n in blocks:
+        if merged:
+            pi, pj, pn = merged[-1]
+            if pi + pn == i and pj + pn == j:
+                merged[-1] = (pi, pj, pn + n)
+                continue
+        merged.append((i, j, n))
+    merged.append((la, lb, 0))
+    return merged
+
+
+def _trim(a, b, alo, ahi, blo, bhi, blocks):
+    """Record the common prefix and suffix of the given ranges as matches,
+    and return the ranges that are left."""
+    start = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start:
+        blocks.append((start, blo - (alo - start), alo - start))
+
+    end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    if ahi < end:
+        blocks.append((ahi, bhi, end - ahi))
+    return alo, ahi, blo, bhi
+
+
+def _myers(a, b, alo, ahi, blo, bhi, blocks, check=None):
+    """Myers' diff of the given ranges, with the search cost bounded.
+
+    Lines that don't appear in the other range at all can't match, so they
+    are left out before searching; a block of changed or re-indented lines
+    then costs nothing to search.
+    """
+    alo, ahi, blo, bhi = _trim(a, b, alo, ahi, blo, bhi, blocks)
+    if alo == ahi or blo == bhi:
+        return
+    in_b = set(b[blo:bhi])
+    a_index = [i for i in range(alo, ahi) if a[i] in in_b]
+    in_a = set(a[alo:ahi])
+    b_index = [j for j in range(blo, bhi) if b[j] in in_a]
+    max_cost = max(MIN_MAX_COST, int((len(a_index) + len(b_index)) ** 0.5))
+    if len(a_index) == ahi - alo and len(b_index) == bhi - blo:
+        _myers_search(a, b, alo, ahi, blo, bhi, blocks, max_cost, check)
+        return
+    if not a_index or not b_index:
+        return
+
+    found = []
+    _myers_search([a[i] for i in a_index], [b[j] for j in b_index], 0, len(a_index), 0, len(b_index), found, max_cost, check)
+    # blocks of the reduced ranges are runs of single lines in the full ones
+    for i, j, size in found:
+        start = 0
+        for offset in range(1, size + 1):
+            if offset == size or a_index[i + offset] != a_index[i + offset - 1] + 1 \
+                    or b_index[j + offset] != b_index[j + offset - 1] + 1:
+                blocks.append((a_index[i + start], b_index[j + start], offset - start))
+                start = offset
+
+
+def _myers_search(a, b, alo, ahi, blo, bhi, blocks, max_cost, check=None):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        if check:
+            check()
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), blocks=blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        split = _bisect(a, b, alo, ahi, blo, bhi, max_cost, check)
+        if split is None:
+            continue
+        if isinstance(split[0], tuple):
+            # the search was cut short: diff the ranges up to the points
+            # it reached from each end, and the range between them
+            (x, y), (x2, y2) = split
+            stack.append((x2, ahi, y2, bhi))
+            stack.append((x, x2, y, y2))
+            stack.append((alo, x, blo, y))
+            continue
+        if split == (alo, blo) or split == (ahi, bhi):
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+
+def _bisect(a, b, alo, ahi, blo, bhi, max_cost, check=None):
+    """Find the middle snake of an O(ND) diff in linear space, and return
+    the point to split the problem at. After `max_cost` edits without
+    finding it, the furthest point reached from either end is used."""
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    v_offset = max_d
+    v_length = 2 * max_d + 2
+    v1 = [-1] * v_length
+    v1[v_offset + 1] = 0
+    v2 = v1[:]
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+
+    for d in range(max_d):
+        if check and not d % 256:
+            check()
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            k1_offset = v_offset + k1
+            if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                x1 = v1[k1_offset + 1]
+            else:
+                x1 = v1[k1_offset - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[k1_offset] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                k2_offset = v_offset + delta - k1
+                if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                    if x1 >= n - v2[k2_offset]:
+                        return alo + x1, blo + y1
+
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            k2_offset = v_offset + k2
+            if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                x2 = v2[k2_offset + 1]
+            else:
+                x2 = v2[k2_offset - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            v2[k2_offset] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                k1_offset = v_offset + delta - k2
+                if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                    x1 = v1[k1_offset]
+                    y1 = v_offset + x1 - k1_offset
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+
+        if d >= max_cost:
+            return _furthest(v1, v2, v_offset, n, m, d, k1start, k1end, k2start, k2end, alo, ahi, blo, bhi)
+    return None
+
+
+def _furthest(v1, v2, v_offset, n, m, d, k1start, k1end, k2start, k2end, alo, ahi, blo, bhi):
+    """The points that the forward and the backward search got furthest to.
+    Both are on optimal paths from their end, so the ranges before, between
+    and after them can be diffed separately."""
+    forward = backward = None
+    best = -1
+    for k1 in range(-d + k1start, d + 1 - k1end, 2):
+        x1 = v1[v_offset + k1]
+        y1 = x1 - k1
+        if 0 <= x1 <= n and 0 <= y1 <= m and x1 + y1 > best:
+            best = x1 + y1
+            forward = x1, y1
+    best = -1
+    for k2 in range(-d + k2start, d + 1 - k2end, 2):
+        x2 = v2[v_offset + k2]
+        y2 = x2 - k2
+        if 0 <= x2 <= n and 0 <= y2 <= m and x2 + y2 > best:
+            best = x2 + y2
+            backward = n - x2, m - y2
+    if forward is None or backward is None:
+        point = forward or backward
+        return point and (alo + point[0], blo + point[1])
+    if forward[0] > backward[0] or forward[1] > backward[1]:
+        # the searches crossed; one split point is enough
+        return alo + forward[0], blo + forward[1]
+    return (alo + forward[0], blo + forward[1]), (alo + backward[0], blo + backward[1])
+
+
+def _patience(a, b, alo, ahi, blo, bhi, blocks, check=None):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        if check:
+            check()
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), blocks=blocks)
+        if alo == ahi or blo == bhi:
+            continue
+
+        anchors = _unique_lcs(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            _myers(a, b, alo, ahi, blo, bhi, blocks, check)
+            continue
+
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            stack.append((alo, i, blo, j))
+            alo, blo = i + 1, j + 1
+        stack.append((alo, ahi, blo, bhi))
+
+
+def _unique_lcs(a, b, alo, ahi, blo, bhi):
+    """Longest common subsequence of the lines that appear exactly once in
+    both ranges, found with patience sorting."""
+    counts = {}
+    for i in range(alo, ahi):
+        line = a[i]
+        if line in counts:
+            counts[line] = None
+        else:
+            counts[line] = i
+    unique_b = {}
+    for j in range(blo, bhi):
+        line = b[j]
+        if counts.get(line) is None:
+            continue
+        if line in unique_b:
+            unique_b[line] = None
+        else:
+            unique_b[line] = j
+
+    pairs = sorted((counts[line], j) for line, j in unique_b.items() if j is not None)
+    if not pairs:
+        return []
+
+    # patience sort on the b index, with back pointers to rebuild the sequence
+    tails = []
+    tail_indexes = []
+    back = [None] * len(pairs)
+    for index, (i, j) in enumerate(pairs):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo:
+            back[index] = tail_indexes[lo - 1]
+        if lo == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[lo] = j
+            tail_indexes[lo] = index
+
+    result = []
+    index = tail_indexes[-1]
+    while index is not None:
+        result.append(pairs[index])
+        index = back[index]
+    result.reverse()
+    return result
+
+
+def _histogram(a, b, alo, ahi, blo, bhi, blocks, check=None):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        if check:
+            check()
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop(), blocks=blocks)
+        if alo == ahi or blo == bhi:
+            continue
+
+        region = _histogram_region(a, b, alo, ahi, blo, bhi)
+        if region is None:
+            _myers(a, b, alo, ahi, blo, bhi, blocks, check)
+            continue
+
+        i, j, size = region
+        blocks.append(region)
+        stack.append((i + size, ahi, j + size, bhi))
+        stack.append((alo, i, blo, j))
+
+
+def _histogram_region(a, b, alo, ahi, blo, bhi):
+    """Find the longest common region built around the least frequent lines
+    of `a`, the way git's histogram diff does."""
+    occurrences = {}
+    for i in range(alo, ahi):
+        occurrences.setdefault(a[i], []).append(i)
+
+    best_count = MAX_CHAIN_LENGTH + 1
+    best = None
+    best_size = 0
+    j = blo
+    while j < bhi:
+        next_j = j + 1
+        positions = occurrences.get(b[j])
+        if positions is not None and len(positions) <= best_count:
+            for i in positions:
+                count = len(positions)
+                si, sj = i, j
+                while si > alo and sj > blo and a[si - 1] == b[sj - 1]:
+                    si -= 1
+                    sj -= 1
+                    count = min(count, len(occurrences[a[si]]))
+                ei, ej = i + 1, j + 1
+                while ei < ahi and ej < bhi and a[ei] == b[ej]:
+                    count = min(count, len(occurrences[a[ei]]))
+                    ei += 1
+                    ej += 1
+                if next_j < ej:
+                    next_j = ej
+                if best_size < ei - si or count < best_count:
+                    best = (si, sj, ei - si)
+                    best_size = ei - si
+                    best_count = count
+        j = next_j
+
+    if best is None or best_count > MAX_CHAIN_LENGTH:
+        return None
+    return best
@@ -0,0 +1,110 @@
+# coding: utf8
+"""Runs external diff tools without blocking, and cleans up after them."""
+import os
+import threading
+from collections import deque
+
+from .content_cache import BinaryFileError, read_text, split_lines
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class DiffTool(object):
+    """One launch of an external diff tool.
+
+    `watched` temp files are checked when the tool exits; `on_exit` is called
+    from the waiting thread with a dict of the ones that changed, mapped to
+    their new (normalized) content. `temp_files` are removed right after.
+    """
+    def __init__(self, command, temp_files=(), watched=(), on_exit=None):
+        self.command = command
+        self.temp_files = list(temp_files)
+        self.watched = [path for path in watched if path]
+        self.on_exit = on_exit
+        self.process = None
+        self.error = None
+        self._signatures = {}
+
+    def start(self):
+        import subprocess
+        self._signatures = dict((path, _signature(path)) for path in self.watched)
+        self.process = subprocess.Popen(self.command)
+
+    def wait(self):
+        self.process.wait()
+        changed = {}
+        for path in self.watched:
+            if _signature(path) != self._signatures.get(path):
+                try:
+                    changed[path] = ''.join(split_lines(read_text(path)))
+                except (IOError, OSError, BinaryFileError):
+                    pass
+        try:
+            if self.on_exit is not None:
+                self.on_exit(changed)
+        finally:
+            self.remove_temp_files()
+
+    def remove_temp_files(self):
+        for path in self.temp_files:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.temp_files = []
+
+
+class DiffToolManager(object):
+    """Tracks the running diff tools. At most `max_running` are started at
+    once, later launches are queued until one of them exits."""
+    def __init__(self, max_running=4):
+        self.max_running = max_running
+        self.running = []
+        self.queue = deque()
+        self._lock = threading.Lock()
+
+    def launch(self, tool):
+        """Start `tool`, or queue it. Returns False if it had to be queued."""
+        with self._lock:
+            if self.max_running and len(self.running) >= self.max_running:
+                self.queue.append(tool)
+                return False
+            self.running.append(tool)
+        self._start(tool)
+        return True
+
+    def _start(self, tool):
+        try:
+            tool.start()
+        except Exception as e:
+            tool.error = e
+            tool.remove_temp_files()
+            self._finished(tool)
+            raise
+        threading.Thread(target=self._wait, args=(tool,), daemon=True).start()
+
+    def _wait(self, tool):
+        try:
+            tool.wait()
+        finally:
+            self._finished(tool)
+
+    def _finished(self, tool):
+        with self._lock:
+            if tool in self.running:
+                self.running.remove(tool)
+            next_tool = None
+            if self.queue and (not self.max_running or len(self.running) < self.max_running):
+                next_tool = self.queue.popleft()
+                self.running.append(next_tool)
+        if next_tool is not None:
+            try:
+                self._start(next_tool)
+            except Exception:
+                pass
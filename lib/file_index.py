@@ -0,0 +1,139 @@
+# coding: utf8
+"""Index of the files in a project folder, refreshed from directory mtimes."""
+import os
+import re
+import threading
+from fnmatch import translate
+
+
+def compile_patterns(patterns):
+    """One regex that matches a name against any of the fnmatch `patterns`."""
+    if not patterns:
+        return None
+    flags = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+    return re.compile('|'.join('(?:{})'.format(translate(pattern)) for pattern in patterns), flags)
+
+
+def scan_dir(path):
+    """List `path` as (files, subdirs, linked subdirs) names, where linked
+    subdirs are symlinks to directories."""
+    files = []
+    subdirs = []
+    linked = []
+    if hasattr(os, 'scandir'):
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.is_dir():
+                        files.append(entry.name)
+                    elif entry.is_symlink():
+                        linked.append(entry.name)
+                    else:
+                        subdirs.append(entry.name)
+                except OSError:
+                    continue
+    else:
+        for name in os.listdir(path):
+            full_path = os.path.join(path, name)
+            if not os.path.isdir(full_path):
+                files.append(name)
+            elif os.path.islink(full_path):
+                linked.append(name)
+            else:
+                subdirs.append(name)
+    files.sort()
+    subdirs.sort()
+    linked.sort()
+    return files, subdirs, linked
+
+
+class FileIndex(object):
+    """The files under `root`, minus the excluded files and folders.
+
+    `refresh()` stats every directory, but only lists the ones whose mtime
+    changed since the last refresh, so keeping a large tree up to date is
+    cheap. Symlinked directories are followed after the rest of the tree,
+    and every directory is listed only once, so a link into the tree or a
+    symlink cycle doesn't list files again. `files` is replaced, never mutated, so it can be read from any
+    thread while a refresh runs.
+    """
+    def __init__(self, root, folder_exclude_patterns=(), file_exclude_patterns=()):
+        self.root = root
+        self.folder_exclude = compile_patterns(folder_exclude_patterns)
+        self.file_exclude = compile_patterns(file_exclude_patterns)
+        self.files = []
+        self.built = False
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, wait=True):
+        """Bring `files` up to date. With `wait=False`, returns right away if
+        another thread is already refreshing."""
+        if not self._lock.acquire(wait):
+            return False
+        try:
+            self._refresh()
+        finally:
+            self._lock.release()
+        return True
+
+    def _refresh(self):
+        old_dirs = self._dirs
+        dirs = {}
+        files = []
+        folder_exclude = self.folder_exclude
+        # (device, inode) of the directories listed, so symlink cycles end
+        visited = set()
+        stack = [self.root]
+        linked_dirs = []
+        while stack or linked_dirs:
+            if not stack:
+                stack.append(linked_dirs.pop())
+            path = stack.pop()
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            # st_ino is 0 where os.stat doesn't provide it (Windows, Python 3.3)
+            identity = (stat.st_dev, stat.st_ino) if stat.st_ino else os.path.realpath(path)
+            if identity in visited:
+                continue
+            visited.add(identity)
+            mtime = stat.st_mtime_ns
+
+            cached = old_dirs.get(path)
+            if cached is not None and cached[0] == mtime:
+                dir_files, dir_subdirs, dir_linked = cached[1], cached[2], cached[3]
+            else:
+                try:
+                    dir_files, dir_subdirs, dir_linked = scan_dir(path)
+                except OSError:
+                    continue
+                if self.file_exclude:
+                    dir_files = [name for name in dir_files if not self.file_exclude.match(name)]
+                if folder_exclude:
+                    dir_subdirs = [name for name in dir_subdirs if not folder_exclude.match(name)]
+                    dir_linked = [name for name in dir_linked if not folder_exclude.match(name)]
+            dirs[path] = (mtime, dir_files, dir_subdirs, dir_linked)
+
+            files.extend(os.path.join(path, name) for name in dir_files)
+            stack.extend(os.path.join(path, name) for name in reversed(dir_subdirs))
+            linked_dirs.extend(os.path.join(path, name) for name in reversed(dir_linked))
+
+        self._dirs = dirs
+        self.files = files
+        self.built = True
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(root, folder_exclude_patterns=(), file_exclude_patterns=()):
+    """The shared `FileIndex` for `root` with these exclude patterns."""
+    key = (root, tuple(folder_exclude_patterns), tuple(file_exclude_patterns))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = FileIndex(root, folder_exclude_patterns, file_exclude_patterns)
+    return index
@@ -0,0 +1,171 @@
+# coding: utf8
+"""Compare two directory trees, diffing only the files that really differ."""
+import os
+
+from . import diff_engine
+from .content_cache import BinaryFileError, read_text, split_lines
+from .file_index import FileIndex
+from .lru import LRUCache
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+PAIRS_PER_TASK = 32
+
+# digests of files that were hashed before, keyed on (path, mtime, size)
+hashes = LRUCache(4 * 1024 * 1024)
+
+
+class FolderDiff(object):
+    """Result of `compare_trees`. `entries` are (status, relative path,
+    added lines, removed lines) tuples, where status is 'M' for modified, 'A'
+    for only in `right`, 'D' for only in `left`, 'B' for binary files that
+    differ, and 'E' for files that could not be read."""
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self.entries = []
+        self.identical = 0
+
+    def counts(self):
+        counts = {'M': 0, 'A': 0, 'D': 0, 'B': 0, 'E': 0}
+        for entry in self.entries:
+            counts[entry[0]] += 1
+        return counts
+
+
+def compare_trees(left, right, folder_exclude_patterns=(), file_exclude_patterns=(), context_lines=3, algorithm='difflib',
+                  workers=None, use_processes=False, check=None, progress=None):
+    """Walk both trees and diff the files that are in both and differ.
+
+    Files are screened cheaply first: different sizes always differ, and
+    otherwise a streamed hash decides, which is remembered for files whose
+    size and mtime haven't changed. The remaining pairs are diffed on a pool of `workers` threads,
+    or processes with `use_processes`. `check` is called regularly and can
+    raise to stop; `progress` is called with a short message.
+    """
+    result = FolderDiff(left, right)
+    left_files = _relative_files(left, folder_exclude_patterns, file_exclude_patterns)
+    right_files = _relative_files(right, folder_exclude_patterns, file_exclude_patterns)
+    if check:
+        check()
+
+    to_diff = []
+    for index, name in enumerate(sorted(left_files | right_files)):
+        if check and not index % 1000:
+            check()
+            if progress:
+                progress('comparing {} files'.format(index))
+        if name not in right_files:
+            result.entries.append(('D', name, 0, 0))
+        elif name not in left_files:
+            result.entries.append(('A', name, 0, 0))
+        elif _same_file(os.path.join(left, name), os.path.join(right, name)):
+            result.identical += 1
+        else:
+            to_diff.append(name)
+
+    tasks = [to_diff[i:i + PAIRS_PER_TASK] for i in range(0, len(to_diff), PAIRS_PER_TASK)]
+    # loaded on first use: multiprocessing is slow to import
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    done = 0
+    with executor_class(max_workers=workers) as executor:
+        futures = [executor.submit(diff_pairs, left, right, names, context_lines, algorithm) for names in tasks]
+        try:
+            for future in futures:
+                for entry in future.result():
+                    if entry is None:
+                        result.identical += 1
+                    else:
+                        result.entries.append(entry)
+                done += PAIRS_PER_TASK
+                if check:
+                    check()
+                if progress:
+                    progress('diffed {} of {} files'.format(min(done, len(to_diff)), len(to_diff)))
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+    result.entries.sort(key=lambda entry: entry[1])
+    return result
+
+
+def _relative_files(root, folder_exclude_patterns, file_exclude_patterns):
+    index = FileIndex(root, folder_exclude_patterns, file_exclude_patterns)
+    index.refresh()
+    start = len(os.path.join(root, ''))
+    return set(path[start:] for path in index.files)
+
+
+def _same_file(left, right):
+    # files that can't be read are diffed, which reports them as errors
+    try:
+        return same_file(left, right)
+    except (IOError, OSError):
+        return False
+
+
+def same_file(left, right):
+    """Cheap identity check: size, then a streamed hash. Equal mtimes don't
+    make files identical, since timestamps are often coarse enough for two
+    edits to get the same one."""
+    left_stat = os.stat(left)
+    right_stat = os.stat(right)
+    if left_stat.st_size != right_stat.st_size:
+        return False
+    return file_hash(left, left_stat) == file_hash(right, right_stat)
+
+
+def file_hash(path, stat=None):
+    if stat is None:
+        stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = hashes.get(key)
+    if digest is None:
+        import hashlib
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        digest = sha.digest()
+        hashes.put(key, digest, 100)
+    return digest
+
+
+def diff_pairs(left, right, names, context_lines, algorithm):
+    """Diff each of `names` between the two trees. Runs in a worker thread or
+    process; returns an entry per name, or None for files whose lines are
+    the same once line endings are normalized."""
+    return [diff_pair(os.path.join(left, name), os.path.join(right, name), name, context_lines, algorithm) for name in names]
+
+
+def diff_pair(left_path, right_path, name, context_lines, algorithm):
+    try:
+        left_lines = _read_lines(left_path)
+        right_lines = _read_lines(right_path)
+    except (IOError, OSError):
+        return ('E', name, 0, 0)
+    if left_lines is None or right_lines is None:
+        return ('B', name, 0, 0)
+
+    added = removed = 0
+    for line in diff_engine.unified_diff(left_lines, right_lines, n=context_lines, algorithm=algorithm):
+        marker = line[:1]
+        if marker == '+':
+            added += 1
+        elif marker == '-':
+            removed += 1
+    if not added and not removed:
+        return None
+    # the '---' and '+++' header lines are not changes
+    return ('M', name, added - 1, removed - 1)
+
+
+def _read_lines(path):
+    """Normalized lines of a text file, or None if it is binary."""
+    try:
+        return split_lines(read_text(path))
+    except BinaryFileError:
+        return None
@@ -0,0 +1,168 @@
+# coding: utf8
+"""File contents at git revisions, read through long-running
+`git cat-file` processes, one pair per repository."""
+import os
+import threading
+
+from .content_cache import LINE_OVERHEAD, decode_text, split_lines
+from .lru import LRUCache
+
+
+class GitError(Exception):
+    pass
+
+
+# work tree root by directory; menus look it up on every draw
+_roots = {}
+
+
+def find_repository(path):
+    """The work tree root that `path` is in, or None. Roots that were found
+    are remembered per directory until `close_all`; not finding one isn't,
+    so a `git init` or clone shows up right away."""
+    start = os.path.dirname(os.path.abspath(path))
+    root = _roots.get(start)
+    if root is not None:
+        return root
+    folder = start
+    while True:
+        if os.path.exists(os.path.join(folder, '.git')):
+            _roots[start] = folder
+            return folder
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            return None
+        folder = parent
+
+
+class _CatFile(object):
+    """One `git cat-file` process in `--batch` or `--batch-check` mode.
+    Started on first use, and again if it died."""
+    def __init__(self, git, root, mode):
+        self.command = [git, 'cat-file', mode]
+        self.root = root
+        self.process = None
+
+    def request(self, name):
+        """Send one object name, and return the header line of the answer."""
+        if self.process is None or self.process.poll() is not None:
+            self.process = _popen(self.command, self.root)
+        try:
+            self.process.stdin.write(name.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            header = self.process.stdout.readline()
+        except (IOError, OSError) as e:
+            self.close()
+            raise GitError('git cat-file failed: {}'.format(e))
+        if not header:
+            self.close()
+            raise GitError('git cat-file exited in {}'.format(self.root))
+        return header.decode('utf-8').rstrip('\n')
+
+    def read(self, size):
+        # the object is followed by a newline
+        data = self.process.stdout.read(size + 1)
+        return data[:size]
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                self.process.wait()
+            except (IOError, OSError):
+                pass
+            self.process = None
+
+
+class Repository(object):
+    """Reads blobs of the repository at `root`. Object ids are looked up with
+    `git cat-file --batch-check`, and blobs that were not read before are
+    read with `git cat-file --batch`; both processes stay running, so looking
+    up many files costs no process startups. Safe to use from any thread."""
+    def __init__(self, root, git='git', blobs=None):
+        self.root = root
+        self.check = _CatFile(git, root, '--batch-check')
+        self.batch = _CatFile(git, root, '--batch')
+        self.blobs = blobs if blobs is not None else LRUCache(32 * 1024 * 1024)
+        self._lock = threading.Lock()
+
+    def object_id(self, revision, path):
+        """The id of the blob of `path` at `revision`. An empty revision means
+        the version in the index."""
+        name = '{}:{}'.format(revision, self.relative_path(path))
+        with self._lock:
+            header = self.check.request(name)
+        parts = header.split(' ')
+        if header.endswith((' missing', ' ambiguous')) or len(parts) != 3:
+            raise GitError('{} not found'.format(name))
+        if parts[1] != 'blob':
+            raise GitError('{} is a {}, not a file'.format(name, parts[1]))
+        return parts[0]
+
+    def get_lines(self, revision, path):
+        """The normalized lines of `path` at `revision`, which are cached by
+        object id and must not be modified. Raises BinaryFileError for binary
+        blobs."""
+        oid = self.object_id(revision, path)
+        lines = self.blobs.get(oid)
+        if lines is not None:
+            return lines
+
+        with self._lock:
+            header = self.batch.request(oid)
+            parts = header.split(' ')
+            if len(parts) != 3:
+                raise GitError('{} not found'.format(oid))
+            data = self.batch.read(int(parts[2]))
+        lines = split_lines(decode_text(data, '{}:{}'.format(revision, self.relative_path(path))))
+        self.blobs.put(oid, lines, len(data) + LINE_OVERHEAD * len(lines))
+        return lines
+
+    def relative_path(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+
+    def close(self):
+        with self._lock:
+            self.check.close()
+            self.batch.close()
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(path, git='git'):
+    """The shared Repository of the work tree that `path` is in, or None."""
+    root = find_repository(path)
+    if root is None:
+        return None
+    with _repositories_lock:
+        repository = _repositories.get(root)
+        if repository is None:
+            repository = _repositories[root] = Repository(root, git)
+        return repository
+
+
+def close_all():
+    """Stop the `git cat-file` processes of all repositories, and forget the
+    repository roots that were found."""
+    with _repositories_lock:
+        repositories = list(_repositories.values())
+        _repositories.clear()
+    _roots.clear()
+    for repository in repositories:
+        repository.close()
+
+
+def _popen(command, cwd):
+    import subprocess
+    startupinfo = None
+    if os.name == 'nt':
+        # don't flash a console window for the background process
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    try:
+        return subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, startupinfo=startupinfo)
+    except OSError as e:
+        raise GitError('could not run {}: {}'.format(command[0], e))
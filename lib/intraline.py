@@ -0,0 +1,123 @@
+# coding: utf8
+"""Word or character level changes between paired lines of a unified diff."""
+import re
+import time
+
+
+WORD_RE = re.compile(r'\w+|\s+|[^\w\s]', re.UNICODE)
+HUNK_RE = re.compile(r'^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@')
+
+# pairs that have less than this much in common are left as whole line changes
+MIN_SIMILARITY = 0.2
+
+
+class IntralineHighlighter(object):
+    """Fed the lines of a unified diff as they are rendered, finds the changed
+    parts of each removed line that is followed by an added line.
+
+    The work is bounded: lines longer than `max_line_length` are skipped, at
+    most `max_pairs` pairs are compared, and once `time_budget` seconds have
+    been spent the rest of the diff falls back to whole line highlighting.
+    Regions are (begin, end) character offsets from the start of the diff.
+    """
+    def __init__(self, mode='word', max_line_length=1000, max_pairs=5000, time_budget=0.5):
+        self.mode = mode
+        self.max_line_length = max_line_length
+        self.max_pairs = max_pairs
+        self.time_budget = time_budget
+        self.spent = 0.0
+        self.pairs = 0
+        self.exhausted = False
+
+        self.offset = 0
+        self.old_remaining = self.new_remaining = 0
+        self.removed = []
+        self.added = []
+        self.deleted_regions = []
+        self.inserted_regions = []
+
+    def feed(self, line):
+        offset = self.offset
+        self.offset += len(line)
+
+        if not (self.old_remaining or self.new_remaining):
+            match = HUNK_RE.match(line)
+            if match:
+                self.old_remaining = int(match.group(1) or 1)
+                self.new_remaining = int(match.group(2) or 1)
+            return
+
+        marker = line[:1]
+        if marker == '-':
+            self.old_remaining -= 1
+            if self.added:
+                self.flush()
+            self.removed.append((offset, line))
+        elif marker == '+':
+            self.new_remaining -= 1
+            self.added.append((offset, line))
+        else:
+            self.old_remaining -= 1
+            self.new_remaining -= 1
+            self.flush()
+        if not (self.old_remaining or self.new_remaining):
+            self.flush()
+
+    def flush(self):
+        removed, added = self.removed, self.added
+        self.removed, self.added = [], []
+        if self.exhausted:
+            return
+
+        for (a_offset, a_line), (b_offset, b_line) in zip(removed, added):
+            a_text = a_line[1:].rstrip('\n')
+            b_text = b_line[1:].rstrip('\n')
+            if len(a_text) > self.max_line_length or len(b_text) > self.max_line_length:
+                continue
+            if self.pairs >= self.max_pairs or self.spent >= self.time_budget:
+                self.exhausted = True
+                return
+            self.pairs += 1
+
+            start = time.time()
+            self.compare(a_offset + 1, a_text, b_offset + 1, b_text)
+            self.spent += time.time() - start
+
+    def compare(self, a_offset, a_text, b_offset, b_text):
+        if self.mode == 'char':
+            a_tokens, b_tokens = a_text, b_text
+        else:
+            a_tokens, b_tokens = WORD_RE.findall(a_text), WORD_RE.findall(b_text)
+
+        from difflib import SequenceMatcher
+        matcher = SequenceMatcher(None, a_tokens, b_tokens, autojunk=False)
+        if matcher.ratio() < MIN_SIMILARITY:
+            return
+
+        a_positions = _positions(a_tokens)
+        b_positions = _positions(b_tokens)
+        deleted = []
+        inserted = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            if i2 > i1:
+                deleted.append((a_offset + a_positions[i1], a_offset + a_positions[i2]))
+            if j2 > j1:
+                inserted.append((b_offset + b_positions[j1], b_offset + b_positions[j2]))
+        self.deleted_regions.extend(deleted)
+        self.inserted_regions.extend(inserted)
+
+    def take_regions(self):
+        """The (deleted, inserted) regions found since the last call."""
+        regions = (self.deleted_regions, self.inserted_regions)
+        self.deleted_regions, self.inserted_regions = [], []
+        return regions
+
+
+def _positions(tokens):
+    """Character offset of each token, plus the end of the last one."""
+    positions = [0]
+    for token in tokens:
+        positions.append(positions[-1] + len(token))
+    return positions
@@ -0,0 +1,109 @@
+# coding: utf8
+"""Incremental line diff between a saved file and the buffer being edited."""
+from . import diff_engine
+
+
+# gaps with more lines than this, on both sides together, once their common
+# leading and trailing lines are matched, are marked as modified without
+# being diffed
+MAX_GAP_LINES = 100000
+
+
+class LiveDiff(object):
+    """Matching blocks between `saved` and the current buffer lines.
+
+    `update()` only re-diffs the lines around an edit: the blocks before and
+    after the edited range are kept, and the gap between them is diffed
+    against the matching range of the saved file. `check` is called while
+    diffing, and can raise `DiffCancelled` when a newer edit makes the
+    result useless.
+    """
+    def __init__(self, saved, buffer, algorithm='histogram', max_gap_lines=MAX_GAP_LINES, check=None):
+        self.saved = saved
+        self.algorithm = algorithm
+        self.max_gap_lines = max_gap_lines
+        self.buffer = list(buffer)
+        self.blocks = self._diff_gap(self.buffer, 0, len(saved), 0, len(self.buffer), check)
+
+    def update(self, buffer, check=None):
+        """Returns False if the buffer lines did not change."""
+        old = self.buffer
+        old_len, new_len = len(old), len(buffer)
+        lo = 0
+        while lo < old_len and lo < new_len and old[lo] == buffer[lo]:
+            lo += 1
+        old_hi, new_hi = old_len, new_len
+        while old_hi > lo and new_hi > lo and old[old_hi - 1] == buffer[new_hi - 1]:
+            old_hi -= 1
+            new_hi -= 1
+        if lo == old_hi == new_hi and old_len == new_len:
+            return False
+
+        self.blocks = self._splice(buffer, lo, old_hi, new_hi - old_hi, check)
+        self.buffer = list(buffer)
+        return True
+
+    def _splice(self, buffer, lo, old_hi, delta, check=None):
+        before = []
+        after = []
+        for i, j, n in self.blocks:
+            if j + n <= lo:
+                before.append((i, j, n))
+            elif j >= old_hi:
+                after.append((i, j + delta, n))
+            else:
+                # the edit cuts through this block, keep the parts outside of it
+                if j < lo:
+                    before.append((i, j, lo - j))
+                if j + n > old_hi:
+                    skip = old_hi - j
+                    after.append((i + skip, old_hi + delta, n - skip))
+
+        saved_lo, buffer_lo = 0, 0
+        if before:
+            i, j, n = before[-1]
+            saved_lo, buffer_lo = i + n, j + n
+        saved_hi, buffer_hi = len(self.saved), len(buffer)
+        if after:
+            saved_hi, buffer_hi = after[0][0], after[0][1]
+
+        return before + self._diff_gap(buffer, saved_lo, saved_hi, buffer_lo, buffer_hi, check) + after
+
+    def _diff_gap(self, buffer, saved_lo, saved_hi, buffer_lo, buffer_hi, check=None):
+        """Matching blocks between the given ranges of the saved and buffer
+        lines. A gap that is still too large once its common ends are
+        matched is all modified, rather than diffed on every keystroke."""
+        saved = self.saved
+        head = 0
+        while saved_lo + head < saved_hi and buffer_lo + head < buffer_hi and saved[saved_lo + head] == buffer[buffer_lo + head]:
+            head += 1
+        tail = 0
+        while saved_hi - tail > saved_lo + head and buffer_hi - tail > buffer_lo + head \
+                and saved[saved_hi - tail - 1] == buffer[buffer_hi - tail - 1]:
+            tail += 1
+
+        blocks = [(saved_lo, buffer_lo, head)] if head else []
+        gap_lo, gap_hi = saved_lo + head, saved_hi - tail
+        buffer_gap_lo, buffer_gap_hi = buffer_lo + head, buffer_hi - tail
+        if (gap_hi - gap_lo) + (buffer_gap_hi - buffer_gap_lo) <= self.max_gap_lines:
+            middle = diff_engine.matching_blocks(saved[gap_lo:gap_hi], buffer[buffer_gap_lo:buffer_gap_hi], self.algorithm, check)[:-1]
+            blocks.extend((gap_lo + i, buffer_gap_lo + j, n) for i, j, n in middle if n)
+        if tail:
+            blocks.append((gap_hi, buffer_gap_hi, tail))
+        return blocks
+
+    def changes(self):
+        """Buffer line numbers that were (added, modified, removed). A removed
+        entry is the line that follows the removed lines."""
+        added = []
+        modified = []
+        removed = []
+        blocks = self.blocks + [(len(self.saved), len(self.buffer), 0)]
+        for tag, i1, i2, j1, j2 in diff_engine.opcodes_from_blocks(blocks):
+            if tag == 'insert':
+                added.extend(range(j1, j2))
+            elif tag == 'replace':
+                modified.extend(range(j1, j2))
+            elif tag == 'delete':
+                removed.append(min(j1, max(len(self.buffer) - 1, 0)))
+        return added, modified, removed
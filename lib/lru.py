@@ -0,0 +1,54 @@
+# coding: utf8
+"""Thread safe LRU cache bounded by the estimated size of its values."""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """Maps keys to values, dropping the least recently used entries once the
+    total `cost` of the values goes over `max_bytes`."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, cost):
+        """Store `value`, unless it is larger than the whole budget."""
+        if cost > self.max_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.used_bytes -= old[1]
+            self._entries[key] = (value, cost)
+            self.used_bytes += cost
+            self._evict()
+        return True
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches `predicate`."""
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.used_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while self.used_bytes > self.max_bytes and self._entries:
+            _, (_, cost) = self._entries.popitem(last=False)
+            self.used_bytes -= cost
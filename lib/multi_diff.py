@@ -0,0 +1,97 @@
+# coding: utf8
+"""Diffs between many inputs: every pair of them, or each against a base."""
+import re
+from array import array
+
+from . import diff_engine
+from .content_cache import split_lines
+
+
+INDENT_RE = re.compile(r'[ \t]*')
+
+
+class Input(object):
+    """One input, split into lines and interned once, so that every diff it
+    is part of shares the work."""
+    def __init__(self, name, lines, ids):
+        self.name = name
+        self.lines = lines
+        self.ids = ids
+
+
+def prepare(names, texts, dedent=False, key=None):
+    """Split, optionally de-indent, and intern `texts`, with one table for
+    all of them so that equal lines get the same id in every input. With
+    `key`, lines that have the same comparison key get the same id."""
+    table = {}
+    setdefault = table.setdefault
+    inputs = []
+    for name, text in zip(names, texts):
+        lines = text if isinstance(text, list) else split_lines(text)
+        if dedent:
+            lines = dedent_lines(lines)
+        keys = lines if key is None else map(key, lines)
+        ids = array('l', (setdefault(line, len(table)) for line in keys))
+        inputs.append(Input(name, lines, ids))
+    return inputs
+
+
+def dedent_lines(lines):
+    """Remove the indent that all non-blank `lines` have in common, in one
+    pass over the lines."""
+    indent = None
+    for line in lines:
+        text = line.rstrip('\n')
+        new_indent = INDENT_RE.match(text).group(0)
+        # ignore blank lines, and lines that only consist of whitespace
+        if len(new_indent) == len(text):
+            continue
+        if indent is None or len(new_indent) < len(indent):
+            indent = new_indent
+        if not indent:
+            return lines
+    if not indent:
+        return lines
+    size = len(indent)
+    # blank lines can be shorter than the indent, but keep their line ending
+    return [line[size:] if len(line.rstrip('\n')) >= size else line[len(line.rstrip('\n')):] for line in lines]
+
+
+def pairs(count, base=None):
+    """Every pair of `count` inputs, or each input against input `base`."""
+    if base is None:
+        return [(i, j) for i in range(count) for j in range(i + 1, count)]
+    return [(base, j) for j in range(count) if j != base]
+
+
+def diff_pair(first, second, n=3, algorithm='difflib', ignore_blank_lines=False, check=None):
+    """The unified diff lines of two prepared inputs."""
+    if first.ids == second.ids:
+        return []
+    if algorithm == 'difflib':
+        opcodes = diff_engine.get_opcodes(first.ids, second.ids, algorithm, check)
+    else:
+        opcodes = diff_engine.opcodes_from_blocks(diff_engine.match_ids(first.ids, second.ids, algorithm, check))
+    groups = diff_engine.get_grouped_opcodes(opcodes, n)
+    if ignore_blank_lines:
+        groups = diff_engine.without_blank_changes(groups, first.lines, second.lines)
+    lines = []
+    for line in diff_engine.format_unified(first.lines, second.lines, groups, first.name, second.name):
+        if not line.endswith('\n'):
+            line += '\n'
+        lines.append(line)
+    return lines
+
+
+def diff_all(inputs, pair_list, n=3, algorithm='difflib', ignore_blank_lines=False, workers=None, check=None):
+    """Diff each of `pair_list` on a thread pool, yielding (pair, diff lines)
+    in the order of `pair_list` as they are done."""
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(diff_pair, inputs[i], inputs[j], n, algorithm, ignore_blank_lines, check) for i, j in pair_list]
+        try:
+            for pair, future in zip(pair_list, futures):
+                yield pair, future.result()
+        finally:
+            for future in futures:
+                future.cancel()
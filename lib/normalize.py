@@ -0,0 +1,49 @@
+# coding: utf8
+"""Comparison keys for diffs that ignore whitespace, case or line endings.
+
+Lines are matched up on their keys, which are computed once per line, and
+the diff still shows the original lines.
+"""
+import re
+
+
+WHITESPACE_MODES = ('all', 'amount', 'trailing')
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def key_function(ignore_whitespace=None, ignore_case=False, ignore_eol=False):
+    """A function from a line to its comparison key, or None when lines are
+    compared as they are.
+
+    `ignore_whitespace` is "all" (whitespace is removed), "amount" (runs of
+    whitespace compare equal, trailing whitespace is ignored) or "trailing".
+    All three also ignore the line ending, like `ignore_eol`.
+    """
+    if ignore_whitespace not in (None, False) + WHITESPACE_MODES:
+        raise ValueError('Unknown ignore_whitespace: {}'.format(ignore_whitespace))
+
+    if ignore_whitespace == 'all':
+        strip = lambda line: WHITESPACE_RE.sub('', line)
+    elif ignore_whitespace == 'amount':
+        strip = lambda line: WHITESPACE_RE.sub(' ', line).rstrip()
+    elif ignore_whitespace == 'trailing':
+        strip = str.rstrip
+    elif ignore_eol:
+        strip = lambda line: line.rstrip('\r\n')
+    else:
+        strip = None
+
+    if not ignore_case:
+        return strip
+    fold = getattr(str, 'casefold', str.lower)
+    if strip is None:
+        return fold
+    return lambda line: fold(strip(line))
+
+
+def comparison_keys(lines, key):
+    """The key of every line, or the lines themselves without a key."""
+    if key is None:
+        return lines
+    return list(map(key, lines))
@@ -0,0 +1,123 @@
+# coding: utf8
+"""Phase timings of recent diffs, and a report of where the time goes."""
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class DiffTimer(object):
+    """Timings and sizes of one diff. Phases can be timed from any thread."""
+    def __init__(self, command):
+        self.command = command
+        self.started = time.time()
+        self.elapsed = None
+        self.phases = OrderedDict()
+        self.stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def set(self, name, value):
+        self.stats[name] = value
+
+    def finish(self):
+        self.elapsed = time.time() - self.started
+
+    def total(self):
+        """Wall time of the whole diff. Phases on different threads overlap,
+        so this can be less than the sum of the phases."""
+        if self.elapsed is not None:
+            return self.elapsed
+        return sum(self.phases.values())
+
+
+class _Phase(object):
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add(self.name, time.time() - self.start)
+
+
+class Profiler(object):
+    """Keeps the last `history` diff timers, and the profile of the slowest
+    diff that was run with profiling on."""
+    def __init__(self, history=200):
+        self.timers = deque(maxlen=history)
+        self.slowest_total = 0.0
+        self.slowest_profile = None
+
+    def resize(self, history):
+        if history != self.timers.maxlen:
+            self.timers = deque(self.timers, maxlen=history)
+
+    def record(self, timer):
+        self.timers.append(timer)
+
+    def record_profile(self, timer, stats_text):
+        """Keep `stats_text` if `timer` is the slowest profiled diff so far.
+        Returns True if it was kept."""
+        total = timer.total()
+        if total <= self.slowest_total:
+            return False
+        self.slowest_total = total
+        self.slowest_profile = (timer, stats_text)
+        return True
+
+    def report(self):
+        timers = list(self.timers)
+        if not timers:
+            return 'No diffs have been timed yet.\n'
+
+        lines = ['FileDiffs timings of the last {} diffs (milliseconds)'.format(len(timers)), '']
+        lines.extend(self._table('Phase', self._group(timers, lambda timer: timer.phases.items())))
+        lines.append('')
+        lines.extend(self._table('Command', self._group(timers, lambda timer: [(timer.command, timer.total())])))
+        lines.append('')
+
+        lines.append('Slowest diffs')
+        for timer in sorted(timers, key=lambda timer: -timer.total())[:5]:
+            phases = ', '.join('{} {:.1f}'.format(name, seconds * 1000) for name, seconds in timer.phases.items())
+            stats = ', '.join('{} {}'.format(name, value) for name, value in timer.stats.items())
+            lines.append('  {:.1f}  {}: {}'.format(timer.total() * 1000, timer.command, phases))
+            if stats:
+                lines.append('         {}'.format(stats))
+
+        if self.slowest_profile is not None:
+            timer, stats_text = self.slowest_profile
+            lines.append('')
+            lines.append('Profile of the slowest profiled diff ({}, {:.1f} ms)'.format(timer.command, timer.total() * 1000))
+            lines.append(stats_text)
+        return '\n'.join(lines) + '\n'
+
+    def _group(self, timers, items):
+        groups = OrderedDict()
+        for timer in timers:
+            for name, seconds in items(timer):
+                groups.setdefault(name, []).append(seconds)
+        return groups
+
+    def _table(self, title, groups):
+        rows = ['  {:<20} {:>6} {:>10} {:>10} {:>10} {:>10}'.format(title, 'count', 'p50', 'p90', 'p99', 'max')]
+        for name, values in groups.items():
+            values.sort()
+            rows.append('  {:<20} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, len(values),
+                percentile(values, 0.5) * 1000, percentile(values, 0.9) * 1000,
+                percentile(values, 0.99) * 1000, values[-1] * 1000))
+        return rows
+
+
+def percentile(values, fraction):
+    """`fraction` percentile of sorted `values`, by nearest rank."""
+    return values[int(round(fraction * (len(values) - 1)))]